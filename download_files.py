@@ -6,6 +6,12 @@ import os
 from utils.worker import Worker
 from utils.visualizer import Visualizer
 from utils.filemanager import FileManager
+from utils.packer import Packer
+from utils.daemon import Daemon
+from utils.resolver import Resolver
+from utils.directories import Directories
+from utils.records import Task
+from utils import profiler
 
 def get_input(filepath):
     """
@@ -16,7 +22,7 @@ def get_input(filepath):
     Returns:
     inputs: dict of inputs and its attributes
     """
-    with open(filepath, 'r') as stream:
+    with open(filepath, 'r') as stream, profiler.span("parse", file=filepath):
         try:
             inputs = yaml.safe_load(stream)
         except yaml.YAMLError as exc:
@@ -45,23 +51,59 @@ if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         description='Download files from different sources with different protocols.')
-    parser.add_argument('--input', required=True,
+    parser.add_argument('--input', required=False,
                         metavar="/path/to/input/",
-                        help='Path to input .yml file')
+                        help='Path to input .yml file, required unless running as daemon')
     parser.add_argument('--config', required=True,
                         metavar="/path/to/config/",
                         help='Path to configurate .yml file')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and accept jobs over local API instead of downloading input')
+    parser.add_argument('--port', type=int, default=None,
+                        help='Loopback port of daemon API')
+    parser.add_argument('--socket', default=None,
+                        metavar="/path/to/socket",
+                        help='Unix socket of daemon API')
+    parser.add_argument('--profile', nargs='?', const='profile.json', default=None,
+                        metavar="/path/to/trace.json",
+                        help='Record time of each stage of every file to Chrome trace file, profile.json if not given')
+    parser.add_argument('--profile-sample', type=int, default=0,
+                        metavar="N",
+                        help='Profile every N-th file of each worker with cProfile when profiling')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Trace memory allocation with tracemalloc when profiling')
     args = parser.parse_args()
 
+    if args.daemon and args.port is None and args.socket is None:
+        parser.error('--daemon requires --port or --socket')
+    if not args.daemon and not args.input:
+        parser.error('--input is required')
+
+    # Start profiling before anything is timed
+    if args.profile:
+        profiler.start(args.profile, args.profile_sample, args.profile_memory)
+
     try:
-        if not FileManager.is_path_exists(args.input):
-            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args.input)
         if not FileManager.is_path_exists(args.config):
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args.config)
 
-        inputs = get_input(args.input)
         config  = get_config(args.config)
 
+        if args.daemon:
+            # Token of loopback port is kept next to config, token of socket next to socket
+            token_path = None
+            if args.socket is None:
+                token_path = os.path.join(os.path.dirname(os.path.abspath(args.config)), "daemon.token")
+            daemon = Daemon(config, port=args.port, socket_path=args.socket, token_path=token_path)
+            print("Accepting jobs on {}, token in {}".format(daemon.address, daemon.token_path))
+            daemon.serve_forever()
+            raise SystemExit
+
+        if not FileManager.is_path_exists(args.input):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args.input)
+
+        inputs = get_input(args.input)
+
         # Quit if inputs is empty
         if not inputs:
             raise Exception("No inputs given")
@@ -69,26 +111,60 @@ if __name__ == '__main__':
         works = Queue(maxsize=0)
         progresses = Queue(maxsize=0)
 
-        # Put work to Queue
-        for i, info in enumerate(inputs.values()):
-            works.put((i + 1, info))
+        # Setup packer if files are packed into shards
+        packer = Packer.from_config(config)
 
-        # Setup workers
-        num_threads = min(config.get("max_worker", 5), len(inputs))
-        for i in range(num_threads):
-            worker = Worker(config, works, progresses, name="worker{}".format(i))
-            worker.setDaemon(True)
-            worker.start()
-
-        # Setup visualizer
-        visualizer = Visualizer(len(inputs), progresses, name="visualizer")
-        visualizer.start()
-
-        # Wait until works Queue and visualizer finished
-        works.join()
-        visualizer.join()
+        try:
+            # Check and create destination directories once, before download
+            directories = Directories.from_config(config)
+            if packer is None:
+                with profiler.span("prepare", batch=True):
+                    directories.prepare(info.get("dest") for info in inputs.values() if isinstance(info, dict))
+
+            # Put work to Queue as compact tasks, dicts of inputs are freed
+            total = len(inputs)
+            for i, info in enumerate(inputs.values()):
+                works.put((i + 1, Task.from_info(info) if isinstance(info, dict) else info))
+            inputs = None
+
+            # Setup resolver shared by workers
+            resolver = Resolver.from_config(config)
+
+            # Setup workers
+            num_threads = min(config.get("max_worker", 5), total)
+            for i in range(num_threads):
+                worker = Worker(config, works, progresses, packer=packer, resolver=resolver,
+                                directories=directories, name="worker{}".format(i))
+                worker.setDaemon(True)
+                worker.start()
+
+            # Setup visualizer
+            visualizer = Visualizer(total, progresses, config.get("max_failures", 10000), config.get("failure_file"),
+                                    name="visualizer")
+            visualizer.start()
+
+            # Wait until works Queue and visualizer finished
+            works.join()
+            visualizer.join()
+
+            # Print connection metrics
+            metrics = resolver.metrics()
+            print("\n{} connections, average connect time {:.1f} ms, {} DNS lookups, {} DNS cache hits".format(
+                metrics["connects"], metrics["avg_connect_time"] * 1000, metrics["dns_lookups"], metrics["dns_cache_hits"]))
+            directories.close()
+        finally:
+            # Write trailer of last shard, also when download is interrupted
+            if packer is not None:
+                packer.close()
 
     except FileNotFoundError as errf:
         print(errf)
     except Exception as e:
-        print(e)
\ No newline at end of file
+        print(e)
+    finally:
+        # Write trace of profiling
+        if profiler.active is not None:
+            summary = profiler.active.summary()
+            for stage, (count, total) in sorted(summary.items(), key=lambda item: -item[1][1]):
+                print("{:<16}{:>10} {:>12.3f} s".format(stage, count, total))
+            print("Profile written to {}".format(", ".join(profiler.stop())))
\ No newline at end of file
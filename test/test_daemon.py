@@ -0,0 +1,187 @@
+import unittest
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import functools
+import http.client
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.daemon import Daemon
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super(UnixHTTPConnection, self).__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class TestDaemon(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Serve files from local server so test does not depend on network
+        cls.root = tempfile.mkdtemp()
+        with open(os.path.join(cls.root, "file.bin"), "wb") as f:
+            f.write(os.urandom(1000))
+        cls.server = HTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=cls.root))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}/file.bin".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.root)
+
+    def setUp(self):
+        self.dest = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dest)
+
+    def start(self, **kwargs):
+        kwargs.setdefault("token_path", os.path.join(self.dest, "daemon.token"))
+        daemon = Daemon({"max_worker": 2, "wait_retry": 0, "max_retry": 1}, **kwargs)
+        self.token = daemon.token
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(daemon.shutdown)
+        return daemon
+
+    def request(self, conn, method, path, body=None, headers=None):
+        if headers is None:
+            headers = {"Authorization": "Bearer " + self.token}
+            if body is not None:
+                headers["Content-Type"] = "application/yaml"
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+
+    def wait_job(self, conn, id):
+        for i in range(100):
+            status, job = self.request(conn, "GET", "/jobs/{}".format(id))
+            if job["done"]:
+                return job
+            time.sleep(0.1)
+        self.fail("job {} not done".format(id))
+
+    def test_submit_job(self):
+        daemon = self.start(port=0)
+        conn = http.client.HTTPConnection(*daemon.server.server_address[:2])
+        inputs = {"file1": {"url": self.url, "dest": self.dest}, "file2": {"url": self.url + "x", "dest": self.dest}}
+
+        status, body = self.request(conn, "POST", "/jobs?priority=1", json.dumps(inputs))
+        self.assertEqual(status, 201)
+        job = self.wait_job(conn, body["id"])
+
+        self.assertEqual(job["success"], 1)
+        self.assertEqual(job["fail"], 1)
+        self.assertEqual(job["files"]["file1"]["filename"], "file.bin")
+        self.assertIn("HTTPError", job["files"]["file2"]["error"])
+        self.assertTrue(os.path.exists(os.path.join(self.dest, "file.bin")))
+
+        status, metrics = self.request(conn, "GET", "/status")
+        self.assertEqual(metrics["submitted"], 2)
+        self.assertEqual(metrics["success"], 1)
+        self.assertEqual(metrics["fail"], 1)
+        self.assertEqual(metrics["active_jobs"], 0)
+
+    def test_bad_job(self):
+        daemon = self.start(port=0)
+        conn = http.client.HTTPConnection(*daemon.server.server_address[:2])
+
+        self.assertEqual(self.request(conn, "POST", "/jobs", "")[0], 400)
+        self.assertEqual(self.request(conn, "POST", "/jobs", "file1: url")[0], 400)
+        self.assertEqual(self.request(conn, "GET", "/jobs/100")[0], 404)
+
+    def test_reserved_attributes(self):
+        daemon = self.start(port=0)
+        conn = http.client.HTTPConnection(*daemon.server.server_address[:2])
+
+        for info in [{"sink": "x"}, {"priority": 1}, {"start": "x"}, {"loop": "x"}, {"key_filename": {"a": 1}}, {"dest": 1}]:
+            inputs = {"file1": dict({"url": self.url, "dest": self.dest}, **info)}
+            status, body = self.request(conn, "POST", "/jobs", json.dumps(inputs))
+            self.assertEqual(status, 400, info)
+
+        # Rejected jobs are not listed and workers are kept
+        status, metrics = self.request(conn, "GET", "/status")
+        self.assertEqual(metrics["submitted"], 0)
+        self.assertEqual(metrics["jobs"], 0)
+        self.assertEqual(metrics["active_jobs"], 0)
+        self.assertTrue(all(worker.is_alive() for worker in daemon.manager.workers))
+
+        status, body = self.request(conn, "POST", "/jobs", json.dumps({"file1": {"url": [self.url, self.url], "dest": self.dest}}))
+        self.assertEqual(self.wait_job(conn, body["id"])["success"], 1)
+
+    def test_rejected(self):
+        daemon = self.start(port=0)
+        conn = http.client.HTTPConnection(*daemon.server.server_address[:2])
+        body = json.dumps({"file1": {"url": self.url, "dest": os.path.join(self.dest, "attack")}})
+        auth = "Bearer " + self.token
+
+        with open(daemon.token_path) as f:
+            self.assertEqual(f.read().strip(), self.token)
+        self.assertEqual(os.stat(daemon.token_path).st_mode & 0o777, 0o600)
+
+        # Token missing or wrong
+        self.assertEqual(self.request(conn, "GET", "/status", headers={})[0], 401)
+        self.assertEqual(self.request(conn, "POST", "/jobs", body, {"Authorization": "Bearer x",
+                                                                     "Content-Type": "application/json"})[0], 401)
+        # Cross site request, even with token
+        self.assertEqual(self.request(conn, "POST", "/jobs", body, {"Authorization": auth, "Origin": "http://example.com",
+                                                                     "Content-Type": "application/json"})[0], 403)
+        # DNS rebinding, Host is the name of attacker
+        conn.putrequest("GET", "/status", skip_host=True)
+        conn.putheader("Host", "example.com:{}".format(daemon.server.server_address[1]))
+        conn.putheader("Authorization", auth)
+        conn.endheaders()
+        self.assertEqual(conn.getresponse().status, 403)
+        conn.close()
+        # Form posts cannot send json
+        for content_type in [None, "text/plain", "application/x-www-form-urlencoded"]:
+            headers = {"Authorization": auth}
+            if content_type is not None:
+                headers["Content-Type"] = content_type
+            self.assertEqual(self.request(conn, "POST", "/jobs", body, headers)[0], 415)
+
+        self.assertEqual(self.request(conn, "GET", "/status")[1]["submitted"], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.dest, "attack")))
+        status, body = self.request(conn, "POST", "/jobs", body, {"Authorization": auth, "Content-Type": "application/json; charset=utf-8"})
+        self.assertEqual(status, 201)
+
+    def test_socket_path_not_socket(self):
+        path = os.path.join(self.dest, "daemon.sock")
+        with open(path, "w") as f:
+            f.write("data")
+        with self.assertRaises(OSError):
+            Daemon({}, socket_path=path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "data")
+
+    def test_unix_socket(self):
+        path = os.path.join(self.dest, "daemon.sock")
+        daemon = self.start(socket_path=path)
+        conn = UnixHTTPConnection(path)
+
+        self.assertEqual(daemon.token_path, os.path.join(self.dest, "daemon.token"))
+        status, body = self.request(conn, "POST", "/jobs", "file1:\n  url: {}\n  dest: {}\n".format(self.url, self.dest))
+        self.assertEqual(self.wait_job(conn, body["id"])["success"], 1)
+        self.assertEqual(len(self.request(conn, "GET", "/jobs")[1]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import os
+import sys
+import shutil
+import threading
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.directories import Directories
+from utils.filemanager import FileManager
+from utils.worker import Worker
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"data")
+
+    def log_message(self, format, *args):
+        pass
+
+class CountingDirectories(Directories):
+    """
+    Directories counting directories created.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingDirectories, self).__init__(*args, **kwargs)
+        self.created = []
+
+    def create(self, path):
+        self.created.append(path)
+        return super(CountingDirectories, self).create(path)
+
+class TestDirectories(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.join(ROOT_DIR, "test", "test_directories")
+        os.makedirs(self.dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_prepare(self):
+        directories = CountingDirectories(parallel=4)
+        paths = [os.path.join(self.dir, "dir{}".format(i % 5)) for i in range(100)]
+        directories.prepare(paths + [None, ""])
+
+        self.assertEqual(sorted(directories.created), sorted(set(paths)))
+        for path in set(paths):
+            self.assertTrue(os.path.isdir(path))
+            self.assertIsNone(directories.get(path))
+        # Prepared directories are not checked again
+        self.assertEqual(len(directories.created), 5)
+
+    def test_concurrent_get(self):
+        directories = CountingDirectories()
+        path = os.path.join(self.dir, "shared")
+        threads = [threading.Thread(target=directories.get, args=(path,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(directories.created, [path])
+
+    def test_failure(self):
+        directories = CountingDirectories(retry_after=30)
+        # Parent does not exist, same as FileManager.is_path_creatable
+        path = os.path.join(self.dir, "missing", "dir")
+        directories.prepare([path])
+        with self.assertRaises(OSError) as first:
+            directories.get(path)
+        with self.assertRaises(OSError) as second:
+            directories.get(path)
+        self.assertEqual(directories.created, [path])
+        # Cached failure raises a new error each time with the same errno
+        self.assertIsNot(first.exception, second.exception)
+        self.assertEqual(first.exception.errno, second.exception.errno)
+        self.assertEqual(first.exception.filename, path)
+
+        directories.retry_after = 0
+        with self.assertRaises(OSError):
+            directories.get(path)
+        self.assertEqual(directories.created, [path, path])
+
+    def test_dir_fd(self):
+        directories = Directories(dir_fd=True)
+        if not directories.dir_fd:
+            self.skipTest("dir_fd is not supported")
+        path = os.path.join(self.dir, "fd")
+        dir_fd = directories.get(path)
+        self.assertIsNotNone(dir_fd)
+
+        filepath = FileManager.random_filepath(path, dir_fd)
+        with FileManager.open_file(filepath, "wb", dir_fd) as f:
+            f.write(b"data")
+        self.assertTrue(FileManager.is_path_exists(filepath, dir_fd))
+        renamed = os.path.join(path, "renamed")
+        FileManager.rename_file(filepath, renamed, dir_fd)
+        with open(renamed, "rb") as f:
+            self.assertEqual(f.read(), b"data")
+        self.assertEqual(FileManager.generate_filepath(renamed, dir_fd=dir_fd), os.path.join(path, "1_renamed"))
+        FileManager.remove_file(renamed, dir_fd)
+        self.assertFalse(os.path.exists(renamed))
+
+        directories.close()
+        self.assertEqual(directories.prepared, {})
+
+    def test_worker(self):
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        directories = Directories(dir_fd=True)
+        path = os.path.join(self.dir, "worker")
+        try:
+            for i in range(2):
+                works = Queue()
+                progresses = Queue()
+                works.put((1, {"url": "http://127.0.0.1:{}/file".format(server.server_port), "dest": path}))
+                worker = Worker({"wait_task": 0, "wait_retry": 0}, works, progresses, directories=directories)
+                worker.start()
+                worker.join()
+                progress = progresses.get()[1]
+                self.assertEqual(progress["state"], "Success")
+                with open(os.path.join(path, progress["filename"]), "rb") as f:
+                    self.assertEqual(f.read(), b"data")
+                # Directory removed after it was prepared is prepared again
+                shutil.rmtree(path)
+        finally:
+            directories.close()
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,304 @@
+import unittest
+import os
+import sys
+import ssl
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import threading
+import urllib.parse
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    from utils.protocols import http2
+except ImportError:
+    h2 = None
+
+from utils.manager import DownloadManager
+from utils.worker import Worker
+
+FILES = dict(("/file{}".format(i), os.urandom(1000 * (i + 1))) for i in range(20))
+FILES["/large"] = os.urandom(300000)
+# Served at /private only with authorization of user:secret
+PRIVATE = os.urandom(1000)
+
+class H2Server:
+    """
+    Minimal HTTP/2 server without TLS, serving FILES with range support and flow control.
+    """
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self.requests = 0
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.serve, args=(sock,), daemon=True).start()
+
+    def serve(self, sock):
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        # Stream id to data left to send
+        pending = {}
+        with sock:
+            while True:
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        self.requests += 1
+                        self.respond(conn, event, pending)
+                    elif isinstance(event, h2.events.StreamReset):
+                        pending.pop(event.stream_id, None)
+
+                # Send as much as windows allow, rest is sent when client updates window
+                for id in list(pending):
+                    while pending[id]:
+                        n = min(conn.local_flow_control_window(id), conn.max_outbound_frame_size, len(pending[id]))
+                        if n <= 0:
+                            break
+                        conn.send_data(id, pending[id][:n])
+                        pending[id] = pending[id][n:]
+                    if not pending[id]:
+                        conn.end_stream(id)
+                        del pending[id]
+                sock.sendall(conn.data_to_send())
+
+    def respond(self, conn, event, pending):
+        headers = dict(event.headers)
+        body = FILES.get(headers[":path"])
+        if headers[":path"] == "/private":
+            if headers.get("authorization") != "Basic dXNlcjpzZWNyZXQ=":
+                conn.send_headers(event.stream_id, [(":status", "401")], end_stream=True)
+                return
+            body = PRIVATE
+        if body is None:
+            conn.send_headers(event.stream_id, [(":status", "404")], end_stream=True)
+            return
+
+        status = "200"
+        fields = [("accept-ranges", "bytes")]
+        if "range" in headers:
+            start, end = headers["range"][len("bytes="):].split("-")
+            end = int(end) + 1 if end else len(body)
+            fields.append(("content-range", "bytes {}-{}/{}".format(start, end - 1, len(body))))
+            body = body[int(start):end]
+            status = "206"
+        fields = [(":status", status), ("content-length", str(len(body)))] + fields
+
+        if headers[":method"] == "HEAD":
+            conn.send_headers(event.stream_id, fields, end_stream=True)
+        else:
+            conn.send_headers(event.stream_id, fields)
+            pending[event.stream_id] = body
+
+    def close(self):
+        self.sock.close()
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(FILES[self.path])))
+        self.end_headers()
+        self.wfile.write(FILES[self.path])
+
+    def log_message(self, format, *args):
+        pass
+
+@unittest.skipIf(h2 is None, "h2 is not installed")
+class TestHTTP2(unittest.TestCase):
+
+    def setUp(self):
+        self.server = H2Server()
+        self.dest = os.path.join(ROOT_DIR, "test", "test_http2")
+        # Small windows so transfers need window updates
+        self.config = {"http2": True, "http2_prior_knowledge": True, "http2_window_size": 65535,
+                       "http2_connection_window": 65535, "max_worker": 5, "max_retry": 1, "wait_retry": 0}
+
+    def tearDown(self):
+        http2.pool.close()
+        self.server.close()
+        shutil.rmtree(self.dest, ignore_errors=True)
+
+    def url(self, path):
+        return "http://127.0.0.1:{}{}".format(self.server.port, path)
+
+    def worker(self, config=None):
+        return Worker(config or self.config, Queue(), Queue())
+
+    def test_multiplex(self):
+        with DownloadManager(self.config) as manager:
+            futures = dict((path, manager.submit(self.url(path), self.dest)) for path in FILES)
+            for path, future in futures.items():
+                with open(os.path.join(self.dest, future.result(timeout=30)["filename"]), "rb") as f:
+                    self.assertEqual(f.read(), FILES[path])
+
+        # All workers share one connection
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests, len(FILES))
+
+    def test_credentials(self):
+        worker = self.worker()
+        url = urllib.parse.urlparse(self.url("/private").replace("//", "//user:secret@"))
+
+        class Writer:
+            data = b""
+            def write(self, data):
+                self.data += data
+
+        f = Writer()
+        http2.fetch(worker, url, {}, f)
+        self.assertEqual(f.data, PRIVATE)
+        with self.assertRaises(Exception):
+            http2.fetch(worker, urllib.parse.urlparse(self.url("/private")), {}, Writer())
+
+    def test_max_streams(self):
+        worker = self.worker(dict(self.config, http2_max_streams=1, http2_connections=2))
+        url = urllib.parse.urlparse(self.url("/file0"))
+        first, _ = http2.request(worker, url, "GET")
+        second, _ = http2.request(worker, url, "GET")
+        self.assertIsNot(first.connection, second.connection)
+        first.close()
+        second.close()
+        self.assertEqual(self.server.connections, 2)
+
+    def test_range(self):
+        worker = self.worker()
+        url = urllib.parse.urlparse(self.url("/large"))
+        self.assertEqual(http2.size(worker, url, {}), len(FILES["/large"]))
+
+        class Writer:
+            data = b""
+            def write(self, data):
+                self.data += data
+
+        f = Writer()
+        http2.fetch(worker, url, {}, f, 100000, 150000)
+        self.assertEqual(f.data, FILES["/large"][100000:250000])
+
+    def test_cancel(self):
+        # Streams closed before end give back their window, connection keeps working
+        worker = self.worker()
+        url = urllib.parse.urlparse(self.url("/large"))
+        for i in range(5):
+            stream, _ = http2.request(worker, url, "GET")
+            next(stream.iter_content(10))
+            stream.close()
+
+        class Writer:
+            data = b""
+            def write(self, data):
+                self.data += data
+
+        f = Writer()
+        http2.fetch(worker, url, {}, f)
+        self.assertEqual(f.data, FILES["/large"])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_stalled_stream(self):
+        # Stream not taking its data does not hold the connection window shared with other streams
+        worker = self.worker(dict(self.config, timeout=5))
+        url = urllib.parse.urlparse(self.url("/large"))
+        stalled, _ = http2.request(worker, url, "GET")
+        stalled.response(5)
+
+        # Wait until server filled the window of stalled stream, which is as large as connection window
+        deadline = time.monotonic() + 5
+        while sum(e.flow_controlled_length for e in list(stalled.events.queue)
+                  if isinstance(e, h2.events.DataReceived)) < 65535 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        class Writer:
+            data = b""
+            def write(self, data):
+                self.data += data
+
+        f = Writer()
+        http2.fetch(worker, url, {}, f)
+        self.assertEqual(f.data, FILES["/large"])
+
+        # Stalled stream still gets the rest of its data when it is taken
+        self.assertEqual(b"".join(stalled.iter_content(5)), FILES["/large"])
+        stalled.close()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_not_found(self):
+        worker = self.worker()
+        with self.assertRaises(Exception):
+            http2.fetch(worker, urllib.parse.urlparse(self.url("/missing")), {}, None)
+
+    def test_fallback(self):
+        # Plain http without prior knowledge is downloaded with HTTP/1.1
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            config = dict(self.config, http2_prior_knowledge=False)
+            with DownloadManager(config) as manager:
+                progress = manager.submit("http://127.0.0.1:{}/file3".format(server.server_port), self.dest).result(timeout=30)
+            with open(os.path.join(self.dest, progress["filename"]), "rb") as f:
+                self.assertEqual(f.read(), FILES["/file3"])
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(self.server.connections, 0)
+
+    def test_alpn_fallback(self):
+        # HTTPS server negotiating only http/1.1 with ALPN is downloaded with HTTP/1.1
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        cert = os.path.join(root, "cert.pem")
+        key = os.path.join(root, "key.pem")
+        try:
+            subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                            "-days", "1", "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("openssl cannot create certificate")
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        context.set_alpn_protocols(["http/1.1"])
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            # Self-signed certificate is trusted as CA bundle
+            config = dict(self.config, ssl_verify=cert)
+            with DownloadManager(config) as manager:
+                futures = dict((path, manager.submit("https://127.0.0.1:{}{}".format(server.server_port, path), self.dest))
+                               for path in ["/file3", "/file4"])
+                for path, future in futures.items():
+                    with open(os.path.join(self.dest, future.result(timeout=30)["filename"]), "rb") as f:
+                        self.assertEqual(f.read(), FILES[path])
+        finally:
+            server.shutdown()
+            server.server_close()
+        # Origin is remembered so it is not negotiated again for every file
+        self.assertIn(("https", "127.0.0.1", server.server_port), http2.pool.http1)
+        self.assertEqual(http2.pool.connections.get(("https", "127.0.0.1", server.server_port)), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import sys
+import io
+import asyncio
+import hashlib
+import shutil
+import tempfile
+import threading
+import functools
+import requests
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.manager import DownloadManager, PriorityWorkQueue
+from utils.sink import BufferSink, StreamSink, IteratorSink
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class TestManager(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Serve files from local server so test does not depend on network
+        cls.root = tempfile.mkdtemp()
+        cls.data = os.urandom(100000)
+        with open(os.path.join(cls.root, "file.bin"), "wb") as f:
+            f.write(cls.data)
+        cls.server = HTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=cls.root))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}/file.bin".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.root)
+
+    def setUp(self):
+        self.manager = DownloadManager({"max_worker": 2, "wait_retry": 0, "max_retry": 1})
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_file_download(self):
+        dest = tempfile.mkdtemp()
+        results = [self.manager.submit(self.url, dest).result(timeout=10) for i in range(3)]
+
+        self.assertEqual(sorted(r["filename"] for r in results), ["1_file.bin", "2_file.bin", "file.bin"])
+        with open(os.path.join(dest, "file.bin"), "rb") as f:
+            self.assertEqual(hashlib.md5(f.read()).hexdigest(), hashlib.md5(self.data).hexdigest())
+        shutil.rmtree(dest)
+
+    def test_fail_download(self):
+        future = self.manager.submit(self.url + "x", sink=BufferSink())
+        with self.assertRaises(requests.exceptions.HTTPError):
+            future.result(timeout=10)
+
+    def test_buffer_sink(self):
+        sink = BufferSink()
+        result = self.manager.submit(self.url, sink=sink).result(timeout=10)
+
+        self.assertEqual(result["state"], "Success")
+        self.assertEqual(sink.getvalue(), self.data)
+
+    def test_stream_sink(self):
+        stream = io.BytesIO()
+        sink = StreamSink(stream)
+        # Emulate retried attempt, data already passed is skipped
+        with sink.open("file") as writer:
+            writer.write(self.data[:10])
+        self.manager.submit(self.url, sink=sink).result(timeout=10)
+
+        self.assertEqual(stream.getvalue(), self.data)
+
+    def test_iterator_sink(self):
+        sink = IteratorSink(maxsize=4)
+        self.manager.submit(self.url, sink=sink)
+
+        self.assertEqual(b"".join(sink), self.data)
+
+    def test_async(self):
+        async def download():
+            sink = IteratorSink()
+            future = self.manager.submit_async(self.url, sink=sink)
+            chunks = [chunk async for chunk in sink]
+            await future
+            return b"".join(chunks)
+
+        self.assertEqual(asyncio.run(download()), self.data)
+
+    def test_cancel(self):
+        # Both workers are blocked writing to sinks nobody reads yet
+        sinks = [IteratorSink(maxsize=1) for i in range(2)]
+        running = [self.manager.submit(self.url, sink=sink) for sink in sinks]
+        buffer = BufferSink()
+        queued = self.manager.submit(self.url, sink=buffer)
+
+        for future in running:
+            while not future.running():
+                threading.Event().wait(0.01)
+            self.assertFalse(future.cancel())
+        self.assertTrue(queued.cancel())
+
+        for sink in sinks:
+            self.assertEqual(b"".join(sink), self.data)
+        for future in running:
+            self.assertEqual(future.result(timeout=10)["state"], "Success")
+        self.manager.close()
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(buffer.getvalue(), b"")
+        self.assertEqual(self.manager.metrics()["cancelled"], 1)
+
+    def test_workers_kept(self):
+        workers = list(self.manager.workers)
+        for i in range(2):
+            self.manager.submit(self.url, sink=BufferSink()).result(timeout=10)
+
+        self.assertEqual(self.manager.workers, workers)
+        self.assertTrue(all(worker.is_alive() for worker in workers))
+
+    def test_broken_sink(self):
+        class BrokenSink(BufferSink):
+            def fail(self, error):
+                raise RuntimeError("broken sink")
+
+        workers = list(self.manager.workers)
+        future = self.manager.submit(self.url + "x", sink=BrokenSink())
+        with self.assertRaises(requests.exceptions.HTTPError):
+            future.result(timeout=10)
+
+        # Workers survive and keep downloading
+        self.assertEqual(self.manager.submit(self.url, sink=BufferSink()).result(timeout=10)["state"], "Success")
+        self.assertTrue(all(worker.is_alive() for worker in workers))
+        self.assertEqual(self.manager.metrics()["fail"], 1)
+
+    def test_priority(self):
+        q = PriorityWorkQueue()
+        q.put((1, 1, {"url": "a"}))
+        q.put((0, 2, {"url": "b"}))
+        q.put((float("inf"), 3, None))
+        q.put((0, 4, {"url": "c"}))
+
+        self.assertEqual([q.get() for i in range(4)], [(2, {"url": "b"}), (4, {"url": "c"}), (1, {"url": "a"}), None])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import os
+import sys
+import threading
+import urllib.parse
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils import mirror
+from utils.mirror import MirrorStats
+from utils.worker import Worker
+from utils.sink import BufferSink
+
+data = os.urandom(100000)
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """
+    Mirror serving data, optionally with range and optionally dropping connection after some bytes.
+    """
+    def do_HEAD(self):
+        self.serve(False)
+
+    def do_GET(self):
+        self.serve(True)
+
+    def serve(self, body):
+        server = self.server
+        server.requests.append((self.command, self.headers.get("Range")))
+        if server.missing:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content = data
+        status = 200
+        if server.ranges and self.headers.get("Range"):
+            start, end = self.headers["Range"][len("bytes="):].split("-")
+            content = data[int(start):int(end) + 1 if end else None]
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if body:
+            if server.broken_after is not None:
+                content = content[:server.broken_after]
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class MirrorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, ranges=True, broken_after=None, missing=False):
+        super(MirrorServer, self).__init__(("127.0.0.1", 0), MirrorHandler)
+        self.ranges = ranges
+        self.broken_after = broken_after
+        self.missing = missing
+        self.requests = []
+        self.url = "http://127.0.0.1:{}/file.bin".format(self.server_port)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        # Do not learn from other tests
+        mirror.stats = MirrorStats()
+
+    def start(self, **kwargs):
+        server = MirrorServer(**kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def download(self, urls, config=None):
+        q = Queue()
+        q2 = Queue()
+        sink = BufferSink()
+        q.put((0, {"url": urls, "sink": sink}))
+
+        config = dict({"wait_task": 0, "wait_retry": 0, "max_retry": 1}, **(config or {}))
+        worker = Worker(config, q, q2)
+        worker.start()
+        worker.join()
+
+        return q2.get()[1], sink.getvalue()
+
+    def assert_resumed(self, server):
+        # Transfer is resumed after data received from broken mirror
+        self.assertEqual(len(server.requests), 1)
+        offset = int(server.requests[0][1][len("bytes="):-1])
+        self.assertTrue(0 < offset <= 30000)
+
+    def test_rank(self):
+        stats = MirrorStats()
+        a, b, c = [(urllib.parse.urlparse(u), None) for u in ["http://a/f", "ftp://user:pass@b/f", "sftp://c/f"]]
+        stats.record(a[0], 1000, 1)
+        stats.record(b[0], 5000, 1)
+        self.assertEqual(stats.rank([a, b, c]), [c, b, a])
+
+        stats.fail(urllib.parse.urlparse("ftp://b/other"))
+        self.assertEqual(stats.rank([a, b, c]), [c, a, b])
+
+    def test_single_url(self):
+        server = self.start()
+        progress, result = self.download(server.url)
+
+        self.assertEqual(progress["state"], "Success")
+        self.assertEqual(result, data)
+
+    def test_failover(self):
+        broken = self.start(broken_after=30000)
+        good = self.start()
+        progress, result = self.download([broken.url, good.url])
+
+        self.assertEqual(progress["state"], "Success")
+        self.assertEqual(result, data)
+        self.assert_resumed(good)
+
+    def test_failover_without_range(self):
+        broken = self.start(broken_after=30000)
+        good = self.start(ranges=False)
+        progress, result = self.download([broken.url, good.url])
+
+        self.assertEqual(result, data)
+        self.assert_resumed(good)
+
+    def test_fastest(self):
+        slow = self.start()
+        fast = self.start()
+        mirror.stats.record(urllib.parse.urlparse(slow.url), 1000, 1)
+        mirror.stats.record(urllib.parse.urlparse(fast.url), 5000, 1)
+        progress, result = self.download([slow.url, fast.url])
+
+        self.assertEqual(result, data)
+        self.assertEqual(slow.requests, [])
+        self.assertEqual(fast.requests, [("GET", None)])
+
+    def test_split(self):
+        servers = [self.start(), self.start(), self.start(missing=True)]
+        config = {"mirror_split_size": 1, "mirror_part_size": 16384}
+        progress, result = self.download([server.url for server in servers], config)
+
+        self.assertEqual(progress["state"], "Success")
+        self.assertEqual(result, data)
+        for server in servers[:2]:
+            self.assertTrue(len([r for r in server.requests if r[0] == "GET"]) >= 2)
+
+    def test_all_fail(self):
+        servers = [self.start(missing=True), self.start(missing=True)]
+        progress, result = self.download([server.url for server in servers])
+
+        self.assertEqual(progress["state"], "Failed")
+        self.assertEqual(len(servers[1].requests), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import os
+import sys
+import csv
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.packer import Packer
+
+class TestPacker(unittest.TestCase):
+
+    def setUp(self):
+        self.pack_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.pack_dir)
+
+    def read_index(self):
+        with open(os.path.join(self.pack_dir, Packer.index_name), "r", newline="") as f:
+            return list(csv.DictReader(f))
+
+    def pack(self, packer, files):
+        for name, data in files:
+            with packer.open(name) as entry:
+                entry.write(data)
+        packer.close()
+
+    def assert_offsets(self, files):
+        rows = self.read_index()
+        self.assertEqual(len(rows), len(files))
+        for row, (name, data) in zip(rows, files):
+            with open(os.path.join(self.pack_dir, row["shard"]), "rb") as f:
+                f.seek(int(row["offset"]))
+                self.assertEqual(f.read(int(row["size"])), data)
+        return rows
+
+    def test_tar_pack(self):
+        files = [("./file/a.bin", b"a" * 1000), ("./file/b.bin", b"b" * 10), ("other/c.bin", b"")]
+        self.pack(Packer(self.pack_dir, "tar"), files)
+
+        rows = self.assert_offsets(files)
+        self.assertEqual([row["name"] for row in rows], ["file/a.bin", "file/b.bin", "other/c.bin"])
+        with tarfile.open(os.path.join(self.pack_dir, "shard-00000.tar")) as tar:
+            self.assertEqual(tar.extractfile("file/a.bin").read(), b"a" * 1000)
+
+    def test_zip_pack(self):
+        files = [("./file/a.bin", b"a" * 1000), ("./file/b.bin", b"b" * 10)]
+        self.pack(Packer(self.pack_dir, "zip"), files)
+
+        self.assert_offsets(files)
+        with zipfile.ZipFile(os.path.join(self.pack_dir, "shard-00000.zip")) as z:
+            self.assertEqual(z.read("file/b.bin"), b"b" * 10)
+
+    def test_roll_shard(self):
+        files = [("f/{}.bin".format(i), bytes([i]) * 4000) for i in range(5)]
+        self.pack(Packer(self.pack_dir, "tar", shard_size=10000), files)
+
+        rows = self.assert_offsets(files)
+        self.assertEqual(len(set(row["shard"] for row in rows)), 3)
+
+        # New packer continues after existing shards and names
+        self.pack(Packer(self.pack_dir, "tar", shard_size=10000), [("f/0.bin", b"new")])
+        rows = self.read_index()
+        self.assertEqual(rows[-1]["name"], "f/1_0.bin")
+        self.assertEqual(rows[-1]["shard"], "shard-00003.tar")
+
+    def test_removed_shard(self):
+        files = [("f/{}.bin".format(i), bytes([i]) * 4000) for i in range(5)]
+        self.pack(Packer(self.pack_dir, "tar", shard_size=10000), files)
+        with open(os.path.join(self.pack_dir, "shard-00002.tar"), "rb") as f:
+            last = f.read()
+
+        # Shard removed before the last one does not make the next packer reuse the last shard
+        os.remove(os.path.join(self.pack_dir, "shard-00000.tar"))
+        self.pack(Packer(self.pack_dir, "tar", shard_size=10000), [("f/new.bin", b"new")])
+        self.assertEqual(self.read_index()[-1]["shard"], "shard-00003.tar")
+        with open(os.path.join(self.pack_dir, "shard-00002.tar"), "rb") as f:
+            self.assertEqual(f.read(), last)
+
+    def test_duplicate_name(self):
+        files = [("file/a.bin", b"1"), ("file/a.bin", b"2"), ("file/a.bin", b"3")]
+        self.pack(Packer(self.pack_dir, "tar"), files)
+
+        rows = self.assert_offsets(files)
+        self.assertEqual([row["name"] for row in rows], ["file/a.bin", "file/1_a.bin", "file/2_a.bin"])
+
+    def test_fail_entry(self):
+        packer = Packer(self.pack_dir, "tar")
+        with self.assertRaises(Exception):
+            with packer.open("file/a.bin") as entry:
+                entry.write(b"partial")
+                raise Exception("Testing fail download")
+        self.pack(packer, [("file/b.bin", b"b")])
+
+        rows = self.read_index()
+        self.assertEqual([row["name"] for row in rows], ["file/b.bin"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import threading
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils import profiler
+from utils.worker import Worker
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"data")
+
+    def log_message(self, format, *args):
+        pass
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.dir = os.path.join(ROOT_DIR, "test", "test_profile")
+        os.makedirs(self.dir, exist_ok=True)
+        self.config = {"wait_task": 0, "wait_retry": 0}
+
+    def tearDown(self):
+        profiler.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def download(self, count):
+        works = Queue()
+        progresses = Queue()
+        for i in range(count):
+            works.put((i + 1, {"url": "http://127.0.0.1:{}/data".format(self.server.server_port),
+                               "dest": os.path.join(self.dir, "files")}))
+        worker = Worker(self.config, works, progresses, name="profiled")
+        worker.start()
+        worker.join()
+        return [progresses.get()[1] for i in range(count)]
+
+    def test_disabled(self):
+        f = object()
+        self.assertIs(profiler.span("transfer"), profiler.null)
+        self.assertIs(profiler.task(1), profiler.null)
+        self.assertIs(profiler.writer(f, profiler.null), f)
+        self.assertEqual(profiler.stop(), [])
+
+    def test_trace(self):
+        path = os.path.join(self.dir, "trace.json")
+        profiler.start(path)
+        for progress in self.download(3):
+            self.assertEqual(progress["state"], "Success")
+
+        summary = profiler.active.summary()
+        for stage in ["schedule wait", "parse", "prepare", "connect", "transfer", "rename", "sleep", "task", "write"]:
+            self.assertIn(stage, summary)
+        self.assertEqual(summary["task"][0], 3)
+
+        self.assertEqual(profiler.stop(), [path])
+        self.assertIsNone(profiler.active)
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        tasks = [event for event in events if event["name"] == "task"]
+        self.assertEqual([event["args"]["state"] for event in tasks], ["Success"] * 3)
+        self.assertEqual(tasks[0]["args"]["filename"], "data")
+        names = [event["args"]["name"] for event in events if event["ph"] == "M"]
+        self.assertIn("profiled", names)
+
+    def test_sample(self):
+        path = os.path.join(self.dir, "trace.json")
+        profiler.start(path, sample=2, memory=True)
+        self.download(3)
+        paths = profiler.stop()
+        self.assertEqual(paths, [path, os.path.join(self.dir, "trace.profiled.prof"),
+                                 os.path.join(self.dir, "trace.memory.txt")])
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+
+        with open(paths[0]) as f:
+            events = json.load(f)["traceEvents"]
+        # First and third task are sampled
+        self.assertEqual(len([event for event in events if event["name"] == "memory"]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
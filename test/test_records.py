@@ -0,0 +1,68 @@
+import unittest
+import os
+import sys
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.records import Task, Progress, FailureLog, describe
+
+class TestRecords(unittest.TestCase):
+
+    def test_task(self):
+        info = {"url": "sftp://host/file", "dest": "".join(["dir", "/sub"]), "key_filename": "key"}
+        task = Task.from_info(info)
+        self.assertEqual(task.get("url"), "sftp://host/file")
+        self.assertEqual(task.get("key_filename"), "key")
+        self.assertIsNone(task.get("sink"))
+        self.assertEqual(task.get("passphrase", "default"), "default")
+        self.assertEqual(task["dest"], "dir/sub")
+        with self.assertRaises(KeyError):
+            task["passphrase"]
+
+        # Destinations of tasks share one string
+        other = Task.from_info({"url": "http://host/other", "dest": "".join(["dir", "/sub"])})
+        self.assertIs(task.dest, other.dest)
+        self.assertIsNone(other.extra)
+        self.assertFalse(hasattr(task, "__dict__"))
+
+    def test_mirrors(self):
+        task = Task(["http://a/file", "http://b/file"], "dir")
+        self.assertEqual(task.get("url"), ("http://a/file", "http://b/file"))
+
+    def test_progress(self):
+        progress = Progress()
+        progress["filename"] = "name"
+        progress["state"] = "Success"
+        copy = progress.copy()
+        progress["state"] = "Failed"
+        self.assertEqual(copy["state"], "Success")
+        self.assertEqual(copy.get("filename"), "name")
+        self.assertEqual(copy.get("error", "none"), "none")
+        self.assertEqual(copy.to_dict(), {"filename": "name", "state": "Success"})
+        self.assertFalse(hasattr(progress, "__dict__"))
+
+    def test_describe(self):
+        self.assertEqual(describe(ValueError("bad value")), "ValueError: bad value")
+        self.assertEqual(describe("message"), "message")
+        self.assertEqual(describe(None), "")
+
+    def test_failure_spill(self):
+        path = os.path.join(ROOT_DIR, "test", "test_failures.tsv")
+        log = FailureLog(limit=2, path=path)
+        try:
+            for i in range(5):
+                log.add(i, "file{}".format(i), IOError("broken\npipe {}".format(i)))
+            log.close()
+
+            self.assertEqual(len(log), 5)
+            self.assertEqual(list(log.items()), [(0, ("file0", "OSError: broken\npipe 0")),
+                                                 (1, ("file1", "OSError: broken\npipe 1"))])
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ["{}\tfile{}\tOSError: broken pipe {}".format(i, i, i) for i in range(2, 5)])
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
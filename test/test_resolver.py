@@ -0,0 +1,128 @@
+import unittest
+import os
+import sys
+import time
+import socket
+import threading
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+
+from utils.resolver import Resolver
+from utils.worker import Worker
+from utils.sink import BufferSink
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"data")
+
+    def log_message(self, format, *args):
+        pass
+
+class FixedResolver(Resolver):
+    """
+    Resolver returning given addresses instead of asking system resolver.
+    """
+    def __init__(self, addresses, **kwargs):
+        super(FixedResolver, self).__init__(**kwargs)
+        self.addresses = addresses
+
+    def resolve(self, host, port):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 0, "", address) for address in self.addresses]
+
+class TestResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.addCleanup(self.listener.close)
+
+    def closed_port(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    def test_cache(self):
+        resolver = Resolver(ttl=60)
+        for i in range(3):
+            resolver.resolve("localhost", 80)
+
+        metrics = resolver.metrics()
+        self.assertEqual(metrics["dns_lookups"], 1)
+        self.assertEqual(metrics["dns_cache_hits"], 2)
+
+    def test_ttl(self):
+        resolver = Resolver(ttl=0)
+        for i in range(2):
+            resolver.resolve("localhost", 80)
+
+        self.assertEqual(resolver.metrics()["dns_lookups"], 2)
+
+    def test_concurrent_resolve(self):
+        resolver = Resolver(ttl=60)
+        threads = [threading.Thread(target=resolver.resolve, args=("localhost", 80)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(resolver.metrics()["dns_lookups"], 1)
+
+    def test_interleave(self):
+        v4 = [(socket.AF_INET, 0, 0, "", ("10.0.0.{}".format(i), 80)) for i in range(3)]
+        v6 = [(socket.AF_INET6, 0, 0, "", ("::{}".format(i), 80, 0, 0)) for i in range(2)]
+
+        self.assertEqual(Resolver.interleave(v6 + v4), [v6[0], v4[0], v6[1], v4[1], v4[2]])
+
+    def test_failed_attempt(self):
+        # First address refuses connection, next one is tried immediately
+        address = self.listener.getsockname()
+        resolver = FixedResolver([("127.0.0.1", self.closed_port()), address], delay=10)
+        start = time.monotonic()
+        sock = resolver.create_connection(("host", 80), timeout=5)
+
+        self.assertEqual(sock.getpeername(), address)
+        self.assertTrue(time.monotonic() - start < 5)
+        self.assertEqual(sock.gettimeout(), 5)
+        sock.close()
+        self.assertEqual(resolver.metrics()["connects"], 1)
+
+    def test_all_failed(self):
+        resolver = FixedResolver([("127.0.0.1", self.closed_port()), ("127.0.0.1", self.closed_port())])
+        with self.assertRaises(ConnectionRefusedError):
+            resolver.create_connection(("host", 80), timeout=5)
+
+        self.assertEqual(resolver.metrics()["connect_fails"], 1)
+
+    def test_http(self):
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        q = Queue()
+        q2 = Queue()
+        sink = BufferSink()
+        resolver = Resolver()
+        url = "http://localhost:{}/file".format(server.server_port)
+        q.put((0, {"url": url, "sink": sink}))
+        q.put((1, {"url": url, "sink": BufferSink()}))
+        worker = Worker({"wait_task": 0}, q, q2, resolver=resolver)
+        worker.start()
+        worker.join()
+
+        self.assertEqual(sink.getvalue(), b"data")
+        metrics = resolver.metrics()
+        self.assertEqual(metrics["dns_lookups"], 1)
+        self.assertTrue(metrics["connects"] >= 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,5 +36,25 @@ class TestVisualizer(unittest.TestCase):
         self.assertEqual(v.fail, v.task)
         self.assertEqual(len(v.results), 1)
 
+    def test_bounded_failures(self):
+        q = Queue()
+        for i in range(3):
+            q.put((i, {"filename": "name", "state": "Failed", "error": ValueError("error")}))
+        path = os.path.join(ROOT_DIR, "test", "test_visualizer_failures.tsv")
+
+        v = Visualizer(3, q, max_failures=1, failure_path=path)
+        v.start()
+        v.join()
+
+        try:
+            self.assertEqual(v.fail, 3)
+            self.assertEqual(len(v.results), 3)
+            # Only description of error is kept
+            self.assertEqual(list(v.results.items()), [(0, ("name", "ValueError: error"))])
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 2)
+        finally:
+            os.remove(path)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -73,6 +73,18 @@ class TestWorker(unittest.TestCase):
         self.assertIsInstance(q2.get()[1]["error"], NoURLException)
         self.assertIsInstance(q2.get()[1]["error"], NoURLException)
     
+    def test_not_mapping(self):
+        q = Queue()
+        q2 = Queue()
+        q.put((0, "http://url"))
+
+        worker = Worker({"wait_task": 0}, q, q2)
+        worker.start()
+        worker.join()
+
+        self.assertEqual(q.unfinished_tasks, 0)
+        self.assertEqual(q2.get()[1]["state"], "Failed")
+
     def test_no_dest(self):
         q = Queue()
         q2 = Queue()
@@ -0,0 +1,354 @@
+import os
+import hmac
+import json
+import stat
+import time
+import errno
+import secrets
+import socketserver
+import threading
+import urllib.parse
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import yaml
+from utils.manager import DownloadManager
+from utils.packer import Packer
+
+class Job:
+    """
+    Job is a batch of files submitted to the daemon together, same as one input file.
+    """
+    def __init__(self, id, priority, names):
+        self.id = id
+        self.priority = priority
+        self.submitted = time.time()
+        self.finished = None
+        self.success = 0
+        self.fail = 0
+        self.lock = threading.Lock()
+        # Dict of progress of each file
+        self.files = OrderedDict((name, {"state": "Queued"}) for name in names)
+
+    def is_done(self):
+        return self.success + self.fail == len(self.files)
+
+    def callback(self, name):
+        """
+        Get function to update job when download of a file is done.
+
+        name: name of file in input
+
+        Returns:
+        callback: function taking future of the file
+        """
+        def done(future):
+            with self.lock:
+                try:
+                    progress = future.result()
+                    self.files[name] = {"state": "Success", "filename": progress.get("filename"),
+                                        "filepath": progress.get("filepath")}
+                    self.success += 1
+                except Exception as e:
+                    self.files[name] = {"state": "Failed", "error": "{}: {}".format(type(e).__name__, e)}
+                    self.fail += 1
+                if self.is_done():
+                    self.finished = time.time()
+        return done
+
+    def summary(self, files=False):
+        """
+        Get state of the job.
+
+        files: include state of each file
+
+        Returns:
+        summary: dict which can be serialized to json
+        """
+        with self.lock:
+            summary = {
+                "id": self.id,
+                "priority": self.priority,
+                "submitted": self.submitted,
+                "finished": self.finished,
+                "total": len(self.files),
+                "success": self.success,
+                "fail": self.fail,
+                "done": self.is_done(),
+            }
+            if files:
+                summary["files"] = dict(self.files)
+        return summary
+
+class Daemon:
+    """
+    Daemon keeps a DownloadManager running and accepts jobs over a local HTTP API,
+    listening on a loopback port or a Unix socket.
+    Workers, and their connections, are kept between jobs so small jobs do not pay for startup.
+
+    POST /jobs?priority=<n>     submit job, body is input yaml or json, returns id of job
+    GET  /jobs                  list jobs
+    GET  /jobs/<id>             state of job and each of its files
+    GET  /status                metrics of the daemon
+
+    Every request must carry the token of the daemon as "Authorization: Bearer <token>".
+    The token is generated on start and written to token_path, readable only by the owner.
+    Requests with an Origin header, or to a loopback port with Host other than the daemon, are
+    rejected so web pages cannot reach the API, and jobs are accepted only as application/json
+    or application/yaml.
+    """
+    # Attributes of submit of DownloadManager which cannot be given by a job
+    reserved = frozenset(["sink", "priority", "start", "loop"])
+
+    def __init__(self, config, port=None, socket_path=None, token_path=None):
+        if port is None and socket_path is None:
+            raise ValueError("daemon requires port or socket path")
+        if socket_path is not None:
+            # Remove socket left by previous daemon
+            remove_socket(socket_path)
+
+        self.config = config
+        # Number of finished jobs kept for status
+        self.max_jobs = config.get("daemon_jobs", 1000)
+        self.packer = Packer.from_config(config)
+        self.manager = DownloadManager(config, packer=self.packer, name="daemon")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.counter = 0
+
+        if socket_path is not None:
+            self.server = UnixHTTPServer(socket_path, DaemonRequestHandler)
+            self.hosts = None
+        else:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), DaemonRequestHandler)
+            port = self.server.server_address[1]
+            # Host headers of requests to the loopback port
+            self.hosts = {"127.0.0.1:{}".format(port), "localhost:{}".format(port)}
+        self.server.daemon = self
+        self.socket_path = socket_path
+
+        if token_path is None:
+            token_path = socket_path + ".token" if socket_path is not None else "daemon.token"
+        self.token_path = token_path
+        self.token = secrets.token_urlsafe(32)
+        write_token(token_path, self.token)
+
+    @property
+    def address(self):
+        if self.socket_path is not None:
+            return self.socket_path
+        return "http://{}:{}".format(*self.server.server_address[:2])
+
+    def submit(self, inputs, priority=0):
+        """
+        Submit files of a job to the manager.
+
+        inputs: dict of inputs and its attributes, same as input file
+        priority: jobs with lower value are downloaded first
+
+        Returns:
+        job: Job of the files
+        """
+        if not isinstance(inputs, dict) or not inputs:
+            raise ValueError("No inputs given")
+        for name, info in inputs.items():
+            if not isinstance(info, dict):
+                raise ValueError("attributes of each input must be a mapping")
+            reserved = self.reserved.intersection(info)
+            if reserved:
+                raise ValueError("input {} has reserved attributes {}".format(name, ", ".join(sorted(reserved))))
+            for key, value in info.items():
+                # Attributes are strings, url can also be a list of mirrors
+                if not isinstance(key, str) or not (isinstance(value, str) or
+                                                    isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                    raise ValueError("attribute {} of input {} must be a string".format(key, name))
+
+        with self.lock:
+            self.counter += 1
+            job = Job(str(self.counter), priority, inputs.keys())
+
+        # Prepare destination directories of the job at once
+        if self.packer is None:
+            self.manager.directories.prepare(info.get("dest") for info in inputs.values())
+
+        for name, info in inputs.items():
+            info = dict(info)
+            future = self.manager.submit(info.pop("url", None), info.pop("dest", None), priority=priority, **info)
+            future.add_done_callback(job.callback(name))
+
+        # Job is listed only once all of its files are submitted
+        with self.lock:
+            self.jobs[job.id] = job
+            self.forget()
+        return job
+
+    def forget(self):
+        """
+        Remove oldest finished jobs when there are more than max_jobs jobs.
+        """
+        for id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[id].is_done():
+                del self.jobs[id]
+
+    def status(self):
+        """
+        Get metrics of the daemon.
+
+        Returns:
+        status: dict which can be serialized to json
+        """
+        status = self.manager.metrics()
+        with self.lock:
+            status["jobs"] = len(self.jobs)
+            status["active_jobs"] = len([job for job in self.jobs.values() if not job.is_done()])
+        return status
+
+    def serve_forever(self):
+        """
+        Serve API until shutdown is called or interrupted.
+        """
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """
+        Stop serving API, called from another thread.
+        """
+        self.server.shutdown()
+
+    def close(self):
+        """
+        Stop accepting jobs and wait for submitted files.
+        """
+        self.server.server_close()
+        if self.socket_path is not None:
+            remove_socket(self.socket_path)
+        if os.path.exists(self.token_path):
+            os.unlink(self.token_path)
+        self.manager.close()
+        if self.packer is not None:
+            self.packer.close()
+
+def remove_socket(path):
+    """
+    Remove Unix socket, raise if the path is something other than a socket.
+
+    path: path of socket
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "Not a socket", path)
+    os.unlink(path)
+
+def write_token(path, token):
+    """
+    Write token to a file only the owner can read, replacing file of previous daemon.
+
+    path: path of token file
+    token: token string
+    """
+    if os.path.lexists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token + "\n")
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handle request to API of Daemon.
+    """
+    # Content types of job accepted, json is also yaml
+    content_types = ("application/json", "application/yaml")
+
+    def do_GET(self):
+        daemon = self.server.daemon
+        if not self.authorize():
+            return
+        path = urllib.parse.urlparse(self.path).path.rstrip("/")
+
+        if path == "/status":
+            self.reply(200, daemon.status())
+        elif path == "/jobs":
+            with daemon.lock:
+                jobs = list(daemon.jobs.values())
+            self.reply(200, [job.summary() for job in jobs])
+        elif path.startswith("/jobs/"):
+            job = daemon.jobs.get(path[len("/jobs/"):])
+            if job is None:
+                self.reply(404, {"error": "job not found"})
+            else:
+                self.reply(200, job.summary(files=True))
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        daemon = self.server.daemon
+        split = urllib.parse.urlparse(self.path)
+        if not self.authorize():
+            return
+
+        if split.path.rstrip("/") != "/jobs":
+            self.reply(404, {"error": "not found"})
+            return
+        if self.headers.get_content_type() not in self.content_types:
+            self.reply(415, {"error": "content type must be one of {}".format(", ".join(self.content_types))})
+            return
+
+        try:
+            query = urllib.parse.parse_qs(split.query)
+            priority = int(query.get("priority", [0])[0])
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            # Json is also yaml
+            inputs = yaml.safe_load(body)
+            job = daemon.submit(inputs, priority)
+        except (ValueError, yaml.YAMLError) as e:
+            self.reply(400, {"error": str(e)})
+        except RuntimeError as e:
+            self.reply(503, {"error": str(e)})
+        else:
+            self.reply(201, {"id": job.id})
+
+    def authorize(self):
+        """
+        Check request comes from a local client holding the token, replying error otherwise.
+
+        Returns:
+        authorized: whether request can be handled
+        """
+        daemon = self.server.daemon
+        if self.headers.get("Origin") is not None:
+            self.reply(403, {"error": "cross origin request"})
+            return False
+        if daemon.hosts is not None and self.headers.get("Host") not in daemon.hosts:
+            self.reply(403, {"error": "invalid host"})
+            return False
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode("utf-8"), daemon.token.encode("utf-8")):
+            self.reply(401, {"error": "invalid token"})
+            return False
+        return True
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,148 @@
+import os
+import time
+import errno
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.filemanager import FileManager
+
+class Directories:
+    """
+    Directories checks and creates destination directories once, shared by all workers,
+    instead of checking and creating the directory of every file.
+    Directories of a whole input can be prepared before download, parallel at a time as stat and mkdir
+    are slow on network filesystems. Failure is remembered for retry_after seconds.
+    With dir_fd, a descriptor of each directory is kept open and files are created, renamed and removed
+    relative to it, so their directory is not looked up again for every file.
+    """
+    def __init__(self, parallel=8, dir_fd=False, retry_after=30):
+        # Number of directories prepared at the same time
+        self.parallel = parallel
+        # Keep descriptor of directory, only where os supports it
+        self.dir_fd = dir_fd and {os.open, os.stat, os.rename, os.unlink} <= os.supports_dir_fd
+        # Seconds failure of a directory is remembered
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        # Path to (descriptor or None, (errno, strerror) of failure or None, time of preparation)
+        self.prepared = {}
+        # Path being prepared to Event, so a directory is prepared once at a time
+        self.preparing = {}
+        # Descriptors of forgotten directories, may still be used by other workers until close
+        self.stale = []
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create directories from config.
+
+        config: dict of config
+
+        Returns:
+        directories: Directories
+        """
+        return cls(config.get("prepare_parallel", 8), config.get("dir_fd", False))
+
+    def prepare(self, paths):
+        """
+        Check and create directories, each directory once.
+        Failure of a directory is not raised, but by get for files in the directory.
+
+        paths: iterable of directory paths, may contain duplicates
+        """
+        paths = set(path for path in paths if path and isinstance(path, str))
+        if not paths:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.parallel, len(paths))) as executor:
+            for path in paths:
+                executor.submit(self.try_get, path)
+
+    def try_get(self, path):
+        try:
+            self.get(path)
+        except Exception:
+            pass
+
+    def get(self, path):
+        """
+        Get prepared directory, preparing it if it is not prepared yet.
+
+        path: path of directory
+
+        Returns:
+        dir_fd: descriptor of directory, or None if descriptors are not kept
+        """
+        while True:
+            with self.lock:
+                prepared = self.prepared.get(path)
+                if prepared is not None and (prepared[1] is None or time.monotonic() - prepared[2] < self.retry_after):
+                    if prepared[1] is not None:
+                        # New error each time, the cached one would be shared and grow its traceback
+                        raise OSError(prepared[1][0], prepared[1][1], path)
+                    return prepared[0]
+                event = self.preparing.get(path)
+                if event is None:
+                    event = self.preparing[path] = threading.Event()
+                    break
+            # Wait for other thread preparing the same directory
+            event.wait()
+
+        dir_fd = error = None
+        try:
+            dir_fd = self.create(path)
+        except Exception as e:
+            error = (getattr(e, "errno", None), getattr(e, "strerror", None) or str(e))
+        finally:
+            with self.lock:
+                self.prepared[path] = (dir_fd, error, time.monotonic())
+                del self.preparing[path]
+            event.set()
+
+        if error is not None:
+            raise OSError(error[0], error[1], path)
+        return dir_fd
+
+    def create(self, path):
+        """
+        Create directory if it does not exist after checking write permission.
+
+        Returns:
+        dir_fd: descriptor of directory, or None if descriptors are not kept
+        """
+        # Create directory if the directory does not exist
+        # Check whether directory has write permission
+        if FileManager.is_path_creatable(path):
+            FileManager.create_directory(path)
+        else:
+            raise OSError(errno.EACCES, os.strerror(errno.EACCES), path)
+
+        if not self.dir_fd:
+            return None
+        try:
+            return os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        except OSError:
+            # Such as too many open files, path is used instead
+            return None
+
+    def forget(self, path):
+        """
+        Forget prepared directory, such as directory removed after it was prepared.
+
+        path: path of directory
+        """
+        with self.lock:
+            prepared = self.prepared.pop(path, None)
+            if prepared is not None and prepared[0] is not None:
+                self.stale.append(prepared[0])
+
+    def close(self):
+        """
+        Close descriptors of directories and forget prepared directories.
+        """
+        with self.lock:
+            for dir_fd in [prepared[0] for prepared in self.prepared.values()] + self.stale:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+            self.prepared.clear()
+            self.stale = []
+
+# Directories shared by workers not given their own
+default = Directories()
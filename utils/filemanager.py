@@ -10,28 +10,41 @@ class FileManager:
         if not FileManager.is_path_exists(path):
             os.makedirs(path, exist_ok=True)
             
+    # Methods taking dir_fd, descriptor of directory of the file, access the file relative to it
     @staticmethod
-    def remove_file(file_path):
-        if os.path.exists(file_path):
-            return os.remove(file_path)
+    def open_file(file_path, mode, dir_fd=None):
+        if dir_fd is None:
+            return open(file_path, mode)
+        return open(os.path.basename(file_path), mode,
+                    opener=lambda name, flags: os.open(name, flags, 0o666, dir_fd=dir_fd))
+
+    @staticmethod
+    def remove_file(file_path, dir_fd=None):
+        if FileManager.is_path_exists(file_path, dir_fd):
+            if dir_fd is None:
+                return os.remove(file_path)
+            return os.unlink(os.path.basename(file_path), dir_fd=dir_fd)
     
     @staticmethod
-    def rename_file(old, new):
-        if os.path.exists(old):
-            os.rename(old, new)
+    def rename_file(old, new, dir_fd=None):
+        if FileManager.is_path_exists(old, dir_fd):
+            if dir_fd is None:
+                os.rename(old, new)
+            else:
+                os.rename(os.path.basename(old), os.path.basename(new), src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
 
     @staticmethod
-    def random_filepath(path):
+    def random_filepath(path, dir_fd=None):
         file_path = os.path.join(path, "{}".format(uuid.uuid4()))
-        if os.path.exists(file_path):
-            return FileManager.random_filepath(path)
+        if FileManager.is_path_exists(file_path, dir_fd):
+            return FileManager.random_filepath(path, dir_fd)
         return file_path
 
     @staticmethod
-    def generate_filepath(file_path, i=1):
+    def generate_filepath(file_path, i=1, dir_fd=None):
         new_file_path = os.path.join(os.path.dirname(file_path), "{}_{}".format(i, os.path.basename(file_path)))
-        if os.path.exists(new_file_path):
-            return FileManager.generate_filepath(file_path, i + 1)
+        if FileManager.is_path_exists(new_file_path, dir_fd):
+            return FileManager.generate_filepath(file_path, i + 1, dir_fd)
         return new_file_path
     
     @staticmethod
@@ -52,5 +65,11 @@ class FileManager:
         return os.access(dirname, os.W_OK)
     
     @staticmethod
-    def is_path_exists(path):
-        return os.path.exists(path)
\ No newline at end of file
+    def is_path_exists(path, dir_fd=None):
+        if dir_fd is None:
+            return os.path.exists(path)
+        try:
+            os.stat(os.path.basename(path), dir_fd=dir_fd)
+        except OSError:
+            return False
+        return True
\ No newline at end of file
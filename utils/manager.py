@@ -0,0 +1,183 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, PriorityQueue
+from utils.worker import Worker
+from utils.resolver import Resolver
+from utils.directories import Directories
+from utils.records import Task
+
+class PriorityWorkQueue(PriorityQueue):
+    """
+    PriorityWorkQueue gives works to workers by priority, lower value first, then in order of submission.
+    Works are put as (priority, i, info) and taken by workers as (i, info) like from Queue.
+    Work with info None is taken as None to stop persistent worker.
+    """
+    def _get(self):
+        priority, i, info = super(PriorityWorkQueue, self)._get()
+        if info is None:
+            return None
+        return (i, info)
+
+class DownloadManager:
+    """
+    DownloadManager downloads files for a program using this package as a library.
+    Files can be submitted at any time, each submission returns a future of its result.
+    Workers are started once and kept waiting for new work until the manager is closed,
+    so they are not started again for every batch.
+    """
+    def __init__(self, config=None, packer=None, name="manager"):
+        # Config, workers wait on the Queue instead of sleeping between works by default
+        self.config = dict(config or {})
+        self.config.setdefault("wait_task", 0)
+        self.name = name
+        # Queue containing works to do
+        self.works = PriorityWorkQueue(maxsize=0)
+        # Queue to get progress report from workers
+        self.progresses = Queue(maxsize=0)
+        # Resolver shared by workers
+        self.resolver = Resolver.from_config(self.config)
+        # Destination directories prepared once, shared by workers
+        self.directories = Directories.from_config(self.config)
+        # Futures of submitted works which are not done
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.closed = False
+        # Metrics
+        self.started = time.time()
+        self.submitted = 0
+        self.success = 0
+        self.fail = 0
+        self.cancelled = 0
+
+        # Setup workers
+        self.workers = []
+        for i in range(self.config.get("max_worker", 5)):
+            worker = Worker(self.config, self.works, self.progresses, packer=packer, persistent=True,
+                            resolver=self.resolver, directories=self.directories, name="{}-worker{}".format(name, i))
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+
+        # Setup dispatcher to resolve futures from progress reports
+        self.dispatcher = threading.Thread(target=self.dispatch, name="{}-dispatcher".format(name))
+        self.dispatcher.setDaemon(True)
+        self.dispatcher.start()
+
+    def submit(self, url, dest=None, sink=None, priority=0, **info):
+        """
+        Submit file to download.
+
+        url: url string of wanted file
+        dest: destination directory, not needed when sink is given
+        sink: Sink to write downloaded data to instead of file in dest
+        priority: files with lower value are downloaded first
+        info: other attributes of input, such as key_filename and passphrase
+
+        Returns:
+        future: concurrent.futures.Future resolved with Progress of the file,
+                or with the error if download failed.
+                It can be cancelled until a worker starts downloading the file.
+        """
+        future = Future()
+        # Future is set running when a worker takes the work, so work cancelled before is skipped
+        task = Task(url, dest, sink, info, start=future.set_running_or_notify_cancel)
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot submit to closed manager")
+            i = next(self.counter)
+            self.futures[i] = future
+            self.submitted += 1
+            self.works.put((priority, i, task))
+        return future
+
+    def submit_async(self, url, dest=None, sink=None, priority=0, loop=None, **info):
+        """
+        Submit file to download from asyncio code.
+
+        Returns:
+        future: asyncio future, awaitable, of the result of submit
+        """
+        # Imported only when used, asyncio is slow to import
+        import asyncio
+        return asyncio.wrap_future(self.submit(url, dest, sink, priority, **info), loop=loop)
+
+    def metrics(self):
+        """
+        Get current state of the manager.
+
+        Returns:
+        metrics: dict of counters
+        """
+        with self.lock:
+            metrics = {
+                "uptime": time.time() - self.started,
+                "workers": len(self.workers),
+                "queued": self.works.qsize(),
+                "pending": len(self.futures),
+                "submitted": self.submitted,
+                "success": self.success,
+                "fail": self.fail,
+                "cancelled": self.cancelled,
+            }
+        metrics.update(self.resolver.metrics())
+        return metrics
+
+    def dispatch(self):
+        """
+        Resolve futures from progress reports of workers.
+        """
+        while True:
+            progress = self.progresses.get()
+            self.progresses.task_done()
+            # Stop dispatcher
+            if progress is None:
+                break
+
+            with self.lock:
+                future = self.futures.pop(progress[0], None)
+                if progress[1].get("state") == "Success":
+                    self.success += 1
+                elif progress[1].get("state") == "Cancelled":
+                    self.cancelled += 1
+                else:
+                    self.fail += 1
+            # Future of cancelled work is already cancelled
+            if future is None or future.done():
+                continue
+
+            if progress[1].get("state") == "Success":
+                future.set_result(progress[1])
+            else:
+                future.set_exception(progress[1].get("error") or Exception("file {} failed".format(progress[0])))
+
+    def close(self, wait=True):
+        """
+        Stop workers after submitted works are done.
+
+        wait: wait until workers and dispatcher stopped
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            # Stop workers after all submitted works
+            for worker in self.workers:
+                self.works.put((float("inf"), next(self.counter), None))
+
+        if wait:
+            for worker in self.workers:
+                worker.join()
+            self.progresses.put(None)
+            self.dispatcher.join()
+            self.directories.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,200 @@
+"""
+Download of a file from a list of equivalent urls, mirrors, possibly with different protocols.
+
+Mirrors are tried fastest first, by throughput learned from previous transfers shared by all workers.
+When transfer from a mirror fails, download is resumed from where it stopped on the next mirror.
+File of at least mirror_split_size bytes in config is downloaded in parts of mirror_part_size bytes
+from all mirrors at the same time.
+"""
+import io
+import time
+import itertools
+import threading
+from utils import protocols
+
+class MirrorStats:
+    """
+    MirrorStats keeps throughput of each mirror server, learned from finished transfers.
+    Mirror which failed recently is tried last until cooldown seconds passed.
+    """
+    def __init__(self, alpha=0.3, cooldown=60):
+        # Weight of new transfer in moving average of throughput
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        # Server to throughput in bytes per second
+        self.throughput = {}
+        # Server to time of last failure
+        self.failed = {}
+
+    @staticmethod
+    def key(url):
+        """
+        Get server of url, without credentials.
+
+        url: ParseResult of url from urllib.parse.urlparse
+
+        Returns:
+        key: scheme and host of url
+        """
+        return "{}://{}".format(url.scheme, url.netloc.rpartition("@")[2])
+
+    def record(self, url, size, seconds):
+        """
+        Record finished transfer.
+
+        url: ParseResult of url from urllib.parse.urlparse
+        size: number of bytes transferred
+        seconds: duration of transfer
+        """
+        key = self.key(url)
+        rate = size / max(seconds, 1e-6)
+        with self.lock:
+            old = self.throughput.get(key)
+            self.throughput[key] = rate if old is None else self.alpha * rate + (1 - self.alpha) * old
+            self.failed.pop(key, None)
+
+    def fail(self, url):
+        """
+        Record failed transfer.
+
+        url: ParseResult of url from urllib.parse.urlparse
+        """
+        with self.lock:
+            self.failed[self.key(url)] = time.time()
+
+    def rank(self, mirrors):
+        """
+        Sort mirrors by order to try.
+        Mirror not measured yet is tried before measured ones so every mirror gets measured,
+        then mirrors with higher throughput. Recently failed mirrors are tried last.
+
+        mirrors: list of (url, backend)
+
+        Returns:
+        mirrors: sorted list of (url, backend)
+        """
+        now = time.time()
+        with self.lock:
+            def order(item):
+                index, (url, backend) = item
+                key = self.key(url)
+                failed = now - self.failed.get(key, float("-inf")) < self.cooldown
+                rate = self.throughput.get(key)
+                return (failed, rate is not None, -(rate or 0), index)
+            return [mirror for index, mirror in sorted(enumerate(mirrors), key=order)]
+
+# Throughput of mirrors shared by all workers
+stats = MirrorStats()
+
+class CountingWriter:
+    """
+    CountingWriter passes data to a writable and counts number of bytes written.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.count += len(data)
+        return len(data)
+
+def fetch(worker, mirrors, info, f):
+    """
+    Download file from mirrors.
+
+    worker: Worker downloading the file
+    mirrors: list of (url, backend), url is ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+    f: writable to write file to
+    """
+    mirrors = stats.rank(mirrors)
+    writer = CountingWriter(f)
+
+    # Download large file from several mirrors at the same time
+    ranged = [mirror for mirror in mirrors if getattr(mirror[1], "ranges", False)]
+    split_size = worker.config.get("mirror_split_size", 0)
+    if split_size and len(ranged) > 1:
+        size = probe_size(worker, ranged, info)
+        if size is not None and size >= split_size:
+            fetch_split(worker, ranged, info, writer, size)
+            return
+
+    error = None
+    for url, backend in mirrors:
+        offset = writer.count
+        # Resume from where previous mirror stopped, mirror which cannot download range is skipped
+        if offset and not getattr(backend, "ranges", False):
+            continue
+
+        start = time.time()
+        try:
+            if offset:
+                backend.fetch(worker, url, info, writer, offset)
+            else:
+                backend.fetch(worker, url, info, writer)
+        except Exception as e:
+            stats.fail(url)
+            error = e
+            continue
+
+        stats.record(url, writer.count - offset, time.time() - start)
+        return
+
+    raise error
+
+def probe_size(worker, mirrors, info):
+    """
+    Get size of file from the first mirror which knows it.
+
+    Returns:
+    size: size of file in bytes, or None if no mirror knows it
+    """
+    for url, backend in mirrors:
+        try:
+            size = backend.size(worker, url, info)
+        except Exception:
+            stats.fail(url)
+            continue
+        if size is not None:
+            return size
+    return None
+
+def fetch_split(worker, mirrors, info, f, size):
+    """
+    Download file in parts, parts are spread over mirrors and downloaded at the same time.
+    Part which failed on a mirror is downloaded from the next mirror.
+
+    worker: Worker downloading the file
+    mirrors: list of (url, backend) which can download range of file
+    info: dict of input attributes
+    f: writable to write file to
+    size: size of file in bytes
+    """
+    part_size = worker.config.get("mirror_part_size", 8 << 20)
+    parallel = worker.config.get("mirror_parallel", len(mirrors))
+    counter = itertools.count()
+
+    def get_part(start, end):
+        first = next(counter)
+        error = None
+        for k in range(len(mirrors)):
+            url, backend = mirrors[(first + k) % len(mirrors)]
+            buffer = io.BytesIO()
+            t = time.time()
+            try:
+                backend.fetch(worker, url, info, buffer, start, end - start)
+                if buffer.tell() != end - start:
+                    raise EOFError("mirror {} returned {} bytes of part {}-{}".format(
+                        stats.key(url), buffer.tell(), start, end - 1))
+            except Exception as e:
+                stats.fail(url)
+                error = e
+                continue
+
+            stats.record(url, end - start, time.time() - t)
+            return buffer.getvalue()
+        raise error
+
+    protocols.fetch_parts(f, 0, size, part_size, parallel, get_part)
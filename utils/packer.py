@@ -0,0 +1,220 @@
+import os
+import re
+import csv
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from utils.filemanager import FileManager
+from utils.sink import Sink
+
+class Packer(Sink):
+    """
+    Packer appends downloaded files into rolling tar or zip shards instead of creating a file per download.
+    Shards are only written sequentially, a new shard is started once the current one reaches the configured size.
+    Every packed file is recorded in an index mapping it to its shard, offset of its data in the shard and its size.
+    Packer is a sink whose writers are PackEntry.
+    """
+    formats = ["tar", "zip"]
+    index_name = "index.csv"
+
+    def __init__(self, path, format="tar", shard_size=1 << 30, spool_size=1 << 24):
+        if format not in self.formats:
+            raise ValueError("unsupported pack format {}".format(format))
+
+        # Directory containing shards and index
+        self.path = path
+        # Archive format of shards
+        self.format = format
+        # Size in bytes at which new shard is started
+        self.shard_size = shard_size
+        # Size in bytes a pack entry is kept in memory before spilling to temporary file
+        self.spool_size = spool_size
+        # Lock to append entries one at a time
+        self.lock = threading.Lock()
+        # Names already in the pack, used to give duplicate names incremental number
+        self.names = set()
+        # Current shard
+        self.shard = None
+        self.fp = None
+        self.archive = None
+
+        FileManager.create_directory(path)
+
+        # Continue after the last existing shard so previous packs are never overwritten,
+        # even if an earlier shard was moved or removed
+        numbers = [int(m.group(1)) for m in (re.match(r"shard-(\d+)\.", f) for f in os.listdir(path)) if m]
+        self.count = max(numbers) + 1 if numbers else 0
+
+        index_path = FileManager.join_path(path, self.index_name)
+        is_new = not FileManager.is_path_exists(index_path)
+        if not is_new:
+            with open(index_path, "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    self.names.add(row["name"])
+
+        self.index_file = open(index_path, "a", newline="")
+        self.index = csv.writer(self.index_file)
+        if is_new:
+            self.index.writerow(["name", "shard", "offset", "size"])
+            self.index_file.flush()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create packer from config.
+
+        config: dict of config
+
+        Returns:
+        packer: Packer, or None if files are not packed
+        """
+        if not config.get("pack_format"):
+            return None
+        return cls(config.get("pack_dir", "./pack"), config.get("pack_format"),
+                   config.get("pack_size", 1 << 30), config.get("pack_spool", 1 << 24))
+
+    def open(self, name):
+        """
+        Create entry to write file to be packed.
+
+        name: path of file inside pack
+
+        Returns:
+        entry: PackEntry which is appended to shard when its context exits without exception
+        """
+        return PackEntry(self, name)
+
+    def add(self, entry):
+        """
+        Append entry to current shard and record it in index.
+
+        entry: PackEntry containing data of file
+        """
+        size = entry.buffer.tell()
+        entry.buffer.seek(0)
+        now = time.time()
+
+        with self.lock:
+            name = self.unique_name(self.arcname(entry.name))
+
+            # Start new shard if entry does not fit, a shard always contains at least one entry
+            if self.fp is None or (self.fp.tell() > 0 and self.fp.tell() + size > self.shard_size):
+                self.roll()
+
+            if self.format == "tar":
+                info = tarfile.TarInfo(name)
+                info.size = size
+                info.mtime = int(now)
+                offset = self.fp.tell() + len(info.tobuf(self.archive.format, self.archive.encoding, self.archive.errors))
+                self.archive.addfile(info, entry.buffer)
+            else:
+                info = zipfile.ZipInfo(name, date_time=time.localtime(now)[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                with self.archive.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as w:
+                    offset = self.fp.tell()
+                    shutil.copyfileobj(entry.buffer, w)
+
+            self.names.add(name)
+            self.index.writerow([name, FileManager.get_basename(self.shard), offset, size])
+            self.index_file.flush()
+
+        entry.name = name
+        entry.path = self.shard
+        entry.offset = offset
+
+    def roll(self):
+        """
+        Close current shard and start a new one.
+        """
+        self.close_shard()
+
+        self.shard = FileManager.join_path(self.path, "shard-{:05d}.{}".format(self.count, self.format))
+        self.count += 1
+        # Fail instead of truncating a shard which already exists
+        self.fp = open(self.shard, "xb")
+        if self.format == "tar":
+            self.archive = tarfile.open(fileobj=self.fp, mode="w", format=tarfile.PAX_FORMAT)
+        else:
+            self.archive = zipfile.ZipFile(self.fp, "w", zipfile.ZIP_STORED, allowZip64=True)
+
+    def close_shard(self):
+        """
+        Finish current shard by writing archive trailer.
+        """
+        if self.archive is not None:
+            self.archive.close()
+            self.fp.close()
+            self.archive = None
+            self.fp = None
+
+    def close(self):
+        """
+        Finish current shard and close index.
+        """
+        with self.lock:
+            self.close_shard()
+            self.index_file.close()
+
+    def unique_name(self, name):
+        """
+        Get name not yet in the pack.
+        Name will have incremental number at the front if name exist, same as FileManager.generate_filepath.
+
+        name: path of file inside pack
+
+        Returns:
+        new_name: unique path of file inside pack
+        """
+        new_name = name
+        i = 1
+        while new_name in self.names:
+            new_name = posixpath.join(posixpath.dirname(name), "{}_{}".format(i, posixpath.basename(name)))
+            i += 1
+        return new_name
+
+    @staticmethod
+    def arcname(path):
+        """
+        Convert destination path to relative path inside pack.
+
+        path: destination path
+
+        Returns:
+        name: normalized relative path
+        """
+        name = posixpath.normpath(path.replace(os.sep, "/"))
+        parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+        return "/".join(parts)
+
+class PackEntry:
+    """
+    PackEntry is a writable file of a Packer.
+    Data is spooled in memory, or in temporary file if large, and appended to a shard as a whole on success,
+    so failed download never leave partial data in the pack.
+    """
+    def __init__(self, packer, name):
+        self.packer = packer
+        # Path of file inside pack, updated to unique name once appended
+        self.name = name
+        # Shard and offset of data, set once appended
+        self.path = None
+        self.offset = None
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=packer.spool_size)
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.packer.add(self)
+        finally:
+            self.buffer.close()
+        return False
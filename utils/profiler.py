@@ -0,0 +1,305 @@
+"""
+Profiler records time spent in each stage of every task, to find where time of a slow run goes.
+
+Stages are recorded as spans: parse, schedule wait, prepare, backend, resolve, connect, auth, transfer, rename and sleep.
+Time spent writing downloaded data is added to transfer span of the file as write and writes.
+Spans are written to a Chrome trace file, which can be opened in chrome://tracing, Perfetto or speedscope.
+Every sample-th task of each thread can be profiled with cProfile, stats are written to a .prof file per thread,
+and memory can be traced with tracemalloc.
+
+Profiling is disabled until start is called, span then returns a span which does nothing.
+"""
+import os
+import json
+import time
+import threading
+import cProfile
+import tracemalloc
+
+# Profiler recording spans, None when profiling is disabled
+active = None
+
+class Span:
+    """
+    Span records time from begin to end of a stage as a complete event of Chrome trace.
+    """
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def begin(self):
+        self.start = time.perf_counter()
+        return self
+
+    def end(self, **args):
+        self.args.update(args)
+        self.profiler.record(self.name, self.start, time.perf_counter(), self.args)
+
+    def set(self, **args):
+        """
+        Add arguments shown with the span.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.end()
+        return False
+
+class TaskSpan(Span):
+    """
+    TaskSpan is the span of a whole task, profiling the task with cProfile if it is sampled.
+    """
+    __slots__ = ("profile",)
+
+    def begin(self):
+        self.profile = self.profiler.sample_begin()
+        return super(TaskSpan, self).begin()
+
+    def end(self, **args):
+        super(TaskSpan, self).end(**args)
+        if self.profile is not None:
+            self.profiler.sample_end(self.profile)
+
+class NullSpan:
+    """
+    NullSpan is returned instead of Span when profiling is disabled.
+    """
+    def begin(self):
+        return self
+
+    def end(self, **args):
+        pass
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+null = NullSpan()
+
+class TimedWriter:
+    """
+    TimedWriter passes data to a writable and adds time spent writing to a span.
+    """
+    def __init__(self, f, span):
+        self.f = f
+        self.span = span
+        self.time = 0.0
+        self.count = 0
+
+    def write(self, data):
+        start = time.perf_counter()
+        n = self.f.write(data)
+        self.time += time.perf_counter() - start
+        self.count += 1
+        self.span.set(write=self.time, writes=self.count)
+        return n
+
+class Profiler:
+    """
+    Profiler collects spans of all threads and writes them to a trace file.
+    """
+    def __init__(self, path, sample=0, memory=False):
+        # Path of Chrome trace file
+        self.path = path
+        # Profile every sample-th task of each thread with cProfile, 0 to disable
+        self.sample = sample
+        # Trace memory allocation with tracemalloc
+        self.memory = memory
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        # Trace events, appended by all threads
+        self.events = []
+        # Thread id to thread name
+        self.threads = {}
+        # Thread name to cProfile.Profile of sampled tasks of the thread
+        self.profiles = {}
+        # One task is profiled at a time, as profilers of threads cannot be enabled together on every version
+        self.sampling = threading.Lock()
+        self.local = threading.local()
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+
+    def span(self, name, args):
+        return Span(self, name, args)
+
+    def task(self, i):
+        return TaskSpan(self, "task", {"i": i})
+
+    def record(self, name, start, end, args):
+        """
+        Record span of current thread.
+
+        name: name of stage
+        start: perf_counter at begin of span
+        end: perf_counter at end of span
+        args: dict of arguments shown with the span
+        """
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        self.events.append({"name": name, "ph": "X", "pid": self.pid, "tid": tid,
+                            "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "args": args})
+
+    def sample_begin(self):
+        """
+        Start cProfile of task if it is sampled.
+
+        Returns:
+        profile: enabled cProfile.Profile, or None if task is not sampled
+        """
+        if not self.sample:
+            return None
+        count = getattr(self.local, "count", 0)
+        self.local.count = count + 1
+        if count % self.sample or not self.sampling.acquire(blocking=False):
+            return None
+
+        name = threading.current_thread().name
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def sample_end(self, profile):
+        profile.disable()
+        self.sampling.release()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.events.append({"name": "memory", "ph": "C", "pid": self.pid, "tid": threading.get_ident(),
+                                "ts": (time.perf_counter() - self.origin) * 1e6, "args": {"current": current, "peak": peak}})
+
+    def summary(self):
+        """
+        Get total time of each stage.
+
+        Returns:
+        summary: dict of stage to (number of spans, total seconds)
+        """
+        summary = {}
+        for event in list(self.events):
+            if event["ph"] != "X":
+                continue
+            count, total = summary.get(event["name"], (0, 0.0))
+            summary[event["name"]] = (count + 1, total + event["dur"] / 1e6)
+            if "write" in event["args"]:
+                count, total = summary.get("write", (0, 0.0))
+                summary["write"] = (count + event["args"]["writes"], total + event["args"]["write"])
+        return summary
+
+    def write(self):
+        """
+        Write trace file, and stats of cProfile and tracemalloc next to it.
+
+        Returns:
+        paths: list of paths of files written
+        """
+        base = os.path.splitext(self.path)[0]
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in self.threads.items()]
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+        paths = [self.path]
+
+        for name, profile in self.profiles.items():
+            path = "{}.{}.prof".format(base, name)
+            profile.dump_stats(path)
+            paths.append(path)
+
+        if self.memory and tracemalloc.is_tracing():
+            path = "{}.memory.txt".format(base)
+            current, peak = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            with open(path, "w") as f:
+                f.write("current {} bytes, peak {} bytes\n".format(current, peak))
+                for stat in stats[:50]:
+                    f.write("{}\n".format(stat))
+            paths.append(path)
+        return paths
+
+def start(path, sample=0, memory=False):
+    """
+    Enable profiling.
+
+    path: path of Chrome trace file to write
+    sample: profile every sample-th task of each thread with cProfile, 0 to disable
+    memory: trace memory allocation with tracemalloc
+
+    Returns:
+    profiler: Profiler
+    """
+    global active
+    active = Profiler(path, sample, memory)
+    active.start()
+    return active
+
+def stop():
+    """
+    Disable profiling and write files.
+
+    Returns:
+    paths: list of paths of files written
+    """
+    global active
+    profiler, active = active, None
+    if profiler is None:
+        return []
+    return profiler.write()
+
+def span(name, **args):
+    """
+    Get span of a stage, used as context manager or with begin and end.
+
+    name: name of stage
+    args: arguments shown with the span
+
+    Returns:
+    span: Span, or NullSpan if profiling is disabled
+    """
+    if active is None:
+        return null
+    return active.span(name, args)
+
+def task(i):
+    """
+    Get span of a whole task.
+
+    i: number of task
+
+    Returns:
+    span: TaskSpan, or NullSpan if profiling is disabled
+    """
+    if active is None:
+        return null
+    return active.task(i)
+
+def writer(f, span):
+    """
+    Get writable adding time spent writing to span.
+
+    f: writable to pass data to
+    span: span of transfer
+
+    Returns:
+    f: TimedWriter, or f if profiling is disabled
+    """
+    if active is None:
+        return f
+    return TimedWriter(f, span)
@@ -0,0 +1,143 @@
+"""
+Registry of protocol backends.
+
+A backend is an object, usually a module, with function fetch(worker, url, info, f) which downloads file at url,
+a ParseResult from urllib.parse.urlparse, and writes it to writable f. It raises exception if download failed,
+retrying, renaming and reporting progress is done by the Worker.
+Backend with attribute ranges set to True can download range of file, with fetch(worker, url, info, f, offset, length),
+and get size of file with size(worker, url, info). Such backend can resume failed download on another mirror.
+
+Backends are imported on first use, so dependency of unused protocol such as paramiko is never loaded.
+Other packages can add backends with register, or with entry points in group "url_file_downloader.protocols"
+whose name is the scheme, for example in setup.py:
+
+    entry_points={"url_file_downloader.protocols": ["gs = mypackage.gs"]}
+"""
+import importlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+entry_point_group = "url_file_downloader.protocols"
+
+# Scheme to backend, or import path of backend which is not imported yet
+_backends = {
+    "http": "utils.protocols.http",
+    "https": "utils.protocols.http",
+    "ftp": "utils.protocols.ftp",
+    "ftps": "utils.protocols.ftp",
+    "sftp": "utils.protocols.sftp",
+    "s3": "utils.protocols.s3",
+}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+def register(scheme, backend):
+    """
+    Register backend of protocol, replacing existing backend of the scheme.
+
+    scheme: scheme of url such as "http"
+    backend: backend object, or import path "package.module" or "package.module:attribute" to import on first use
+    """
+    with _lock:
+        _backends[scheme.lower()] = backend
+
+def get(scheme):
+    """
+    Get backend of protocol, importing it if not yet imported.
+
+    scheme: scheme of url such as "http"
+
+    Returns:
+    backend: backend object, or None if protocol is not supported
+    """
+    scheme = scheme.lower()
+    backend = _backends.get(scheme)
+    if backend is None and not _entry_points_loaded:
+        # Looking up installed packages is slow, only do it for unknown scheme
+        _load_entry_points()
+        backend = _backends.get(scheme)
+    if backend is None or hasattr(backend, "fetch"):
+        return backend
+
+    with _lock:
+        backend = _backends[scheme]
+        if not hasattr(backend, "fetch"):
+            backend = _import(backend)
+            _backends[scheme] = backend
+    return backend
+
+def schemes():
+    """
+    Get supported schemes.
+
+    Returns:
+    schemes: sorted list of schemes
+    """
+    _load_entry_points()
+    return sorted(_backends)
+
+def _import(backend):
+    """
+    Import backend from entry point or import path.
+    """
+    if hasattr(backend, "load"):
+        return backend.load()
+
+    module, _, attribute = backend.partition(":")
+    backend = importlib.import_module(module)
+    for name in filter(None, attribute.split(".")):
+        backend = getattr(backend, name)
+    return backend
+
+def _load_entry_points():
+    """
+    Add backends from entry points of installed packages, without importing them.
+    Backend registered with register takes precedence.
+    """
+    global _entry_points_loaded
+    with _lock:
+        if _entry_points_loaded:
+            return
+        _entry_points_loaded = True
+
+        try:
+            from importlib import metadata
+            try:
+                eps = metadata.entry_points(group=entry_point_group)
+            except TypeError:
+                eps = metadata.entry_points().get(entry_point_group, [])
+        except ImportError:
+            try:
+                import pkg_resources
+                eps = pkg_resources.iter_entry_points(entry_point_group)
+            except ImportError:
+                eps = []
+
+        for ep in eps:
+            _backends.setdefault(ep.name.lower(), ep)
+
+def fetch_parts(f, start, end, part_size, parallel, get_part):
+    """
+    Download range of file in parts in parallel and write them in order.
+    At most parallel parts are kept in memory.
+
+    f: writable to write file to
+    start: position of first byte of range
+    end: position after last byte of range
+    part_size: size of part in bytes
+    parallel: number of parts downloaded at the same time
+    get_part: function taking start and end of part and returning bytes of the part
+    """
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        parts = deque()
+        try:
+            for part_start in range(start, end, part_size):
+                parts.append(pool.submit(get_part, part_start, min(part_start + part_size, end)))
+                if len(parts) >= parallel:
+                    f.write(parts.popleft().result())
+            while parts:
+                f.write(parts.popleft().result())
+        finally:
+            for part in parts:
+                part.cancel()
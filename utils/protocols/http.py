@@ -0,0 +1,159 @@
+"""
+Backend of HTTP and HTTPS protocol.
+
+HTTP/1.1 is spoken with requests, one connection per worker and origin.
+If http2 is set in config, files are downloaded with the HTTP/2 transport in utils.protocols.http2 instead.
+"""
+import socket
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import connection, connectionpool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Backend can download range of file
+ranges = True
+
+class ResolverAdapter(HTTPAdapter):
+    """
+    ResolverAdapter is a transport adapter of requests connecting through a Resolver,
+    so HTTP shares cached addresses and connection racing with other protocols.
+    """
+    def __init__(self, resolver, *args, **kwargs):
+        self.resolver = resolver
+        super(ResolverAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(ResolverAdapter, self).init_poolmanager(*args, **kwargs)
+        resolver = self.resolver
+
+        def new_conn(conn):
+            # Same as urllib3 HTTPConnection._new_conn but connect with resolver
+            timeout = conn.timeout if isinstance(conn.timeout, (int, float)) else None
+            try:
+                return resolver.create_connection((getattr(conn, "_dns_host", conn.host), conn.port), timeout,
+                                                  conn.source_address, conn.socket_options)
+            except socket.timeout as e:
+                raise ConnectTimeoutError(conn, "Connection to {} timed out. (connect timeout={})".format(conn.host, timeout))
+            except OSError as e:
+                raise NewConnectionError(conn, "Failed to establish a new connection: {}".format(e))
+
+        class HTTPConnection(connection.HTTPConnection):
+            _new_conn = new_conn
+
+        class HTTPSConnection(connection.HTTPSConnection):
+            _new_conn = new_conn
+
+        class HTTPConnectionPool(connectionpool.HTTPConnectionPool):
+            ConnectionCls = HTTPConnection
+
+        class HTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+            ConnectionCls = HTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {"http": HTTPConnectionPool, "https": HTTPSConnectionPool}
+
+def session(worker):
+    """
+    Get HTTP session of worker, session is kept across works to reuse connections.
+
+    worker: Worker downloading the file
+
+    Returns:
+    session: requests.Session
+    """
+    if worker.session is None:
+        worker.session = requests.Session()
+        adapter = ResolverAdapter(worker.resolver)
+        worker.session.mount("http://", adapter)
+        worker.session.mount("https://", adapter)
+    return worker.session
+
+def size(worker, url, info):
+    """
+    Get size of file.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+
+    Returns:
+    size: size of file in bytes, or None if unknown or server does not support range
+    """
+    if worker.config.get("http2", False):
+        # Imported only when enabled, h2 is optional
+        from utils.protocols import http2
+        return http2.size(worker, url, info)
+    return size_http1(worker, url, info)
+
+def size_http1(worker, url, info):
+    """
+    Get size of file with HTTP/1.1.
+    """
+    # ssl_verify is passed with each request, as verify of session is overridden by REQUESTS_CA_BUNDLE
+    with session(worker).head(url.geturl(), allow_redirects=True, timeout=worker.config.get("timeout", 10),
+                              verify=worker.config.get("ssl_verify", True)) as r:
+        r.raise_for_status()
+        if r.headers.get("Accept-Ranges") != "bytes" or "Content-Length" not in r.headers:
+            return None
+        return int(r.headers["Content-Length"])
+
+def fetch(worker, url, info, f, offset=0, length=None):
+    """
+    Download file using http and https protocol.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+    f: writable to write file to
+    offset: position in file to start download from
+    length: number of bytes to download, until end of file if None
+    """
+    if worker.config.get("http2", False):
+        # Imported only when enabled, h2 is optional
+        from utils.protocols import http2
+        http2.fetch(worker, url, info, f, offset, length)
+        return
+    fetch_http1(worker, url, info, f, offset, length)
+
+def fetch_http1(worker, url, info, f, offset=0, length=None):
+    """
+    Download file with HTTP/1.1.
+    """
+    headers = {}
+    if offset or length is not None:
+        headers["Range"] = "bytes={}-{}".format(offset, "" if length is None else offset + length - 1)
+
+    with session(worker).get(url.geturl(), headers=headers, stream=True, timeout=worker.config.get("timeout", 10),
+                             verify=worker.config.get("ssl_verify", True)) as r:
+        r.raise_for_status()
+        # Server not supporting range sends whole file, skip data before offset
+        write_body(worker, r.iter_content(chunk_size=worker.config.get("chunk_size", 8192)), f,
+                   offset if r.status_code != 206 else 0, length)
+
+def write_body(worker, chunks, f, skip=0, length=None):
+    """
+    Write body of response to file.
+
+    worker: Worker downloading the file
+    chunks: iterator of bytes of body
+    f: writable to write file to
+    skip: number of bytes at start of body not written
+    length: number of bytes written, until end of body if None
+    """
+    remaining = length
+    # Download file in small chunk to prevent out of memory
+    for chunk in chunks:
+        if skip:
+            n = min(skip, len(chunk))
+            chunk = chunk[n:]
+            skip -= n
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if chunk:
+            f.write(chunk)
+        # Use for unit testing to emulate fail download
+        # Can ignore
+        if worker.test_net:
+            raise Exception("Testing fail download")
+        if remaining == 0:
+            break
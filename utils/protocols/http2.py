@@ -0,0 +1,487 @@
+"""
+HTTP/2 transport of the http backend, used when http2 is set in config. Requires package h2.
+
+Requests of all workers to an origin are sent as streams multiplexed over at most http2_connections
+connections, shared by all workers, so many small files do not need a connection each.
+Another connection is opened when every connection has http2_max_streams streams, or as many as server accepts.
+Receive window of each stream is http2_window_size bytes and of each connection http2_connection_window bytes.
+Window of a stream is given back when its data is written, window of the connection as soon as data is received,
+so a slow writer slows down only its own stream and holds at most http2_window_size bytes waiting in memory.
+HTTPS origin which does not negotiate h2 with ALPN is downloaded with HTTP/1.1.
+Credentials in url are sent as Basic authorization, same as with HTTP/1.1.
+Plain http origin is spoken HTTP/2 without upgrade only if http2_prior_knowledge is set in config.
+"""
+import ssl
+import base64
+import socket
+import selectors
+import threading
+import urllib.parse
+from queue import Queue, Empty
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import h2.settings
+import h2.errors
+import requests
+from utils.protocols import http
+
+# Status codes of redirect followed, same as requests
+redirects = (301, 302, 303, 307, 308)
+
+class Stream:
+    """
+    Stream is a request sent on a Connection, events of the stream are put to its queue by reader of the connection.
+    """
+    def __init__(self, connection, id):
+        self.connection = connection
+        self.id = id
+        self.events = Queue(maxsize=0)
+        self.status = None
+        self.headers = {}
+        self.ended = False
+        # Bytes taken and not yet given back to stream window
+        self.consumed = 0
+
+    def response(self, timeout):
+        """
+        Wait for response headers.
+
+        timeout: seconds to wait for each event
+
+        Returns:
+        status: status code of response
+        """
+        while self.status is None:
+            self.take(timeout)
+        return self.status
+
+    def iter_content(self, timeout):
+        """
+        Iterate data of response, data is acknowledged to server as it is taken.
+
+        timeout: seconds to wait for each chunk
+
+        Returns:
+        chunks: iterator of bytes
+        """
+        while not self.ended:
+            chunk = self.take(timeout)
+            if chunk:
+                yield chunk
+
+    def take(self, timeout):
+        try:
+            event = self.events.get(timeout=timeout)
+        except Empty:
+            raise socket.timeout("HTTP/2 stream {} timed out".format(self.id))
+
+        if isinstance(event, Exception):
+            self.ended = True
+            raise event
+        if isinstance(event, h2.events.ResponseReceived):
+            headers = dict(event.headers)
+            self.status = int(headers.pop(":status"))
+            self.headers = headers
+        elif isinstance(event, h2.events.DataReceived):
+            # Window is given back in batches of half window, same as h2
+            self.consumed += event.flow_controlled_length
+            if self.consumed >= self.connection.window_size // 2:
+                self.connection.acknowledge(self.id, self.consumed)
+                self.consumed = 0
+            return event.data
+        elif isinstance(event, h2.events.StreamEnded):
+            self.ended = True
+        return None
+
+    def close(self):
+        """
+        Cancel stream if response is not read to the end, and release it from connection.
+        """
+        self.connection.close_stream(self, cancel=not self.ended)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class Connection:
+    """
+    Connection is an HTTP/2 connection to an origin, shared by workers.
+    A reader thread receives frames and passes events to the stream they belong to.
+    Socket is read and written only under lock, as TLS socket cannot be used by two threads at the same time.
+    """
+    def __init__(self, sock, scheme, authority, window_size=4 << 20, connection_window=16 << 20, max_streams=100):
+        self.sock = sock
+        self.scheme = scheme
+        self.authority = authority
+        self.window_size = window_size
+        self.connection_window = connection_window
+        # Bytes received and not yet given back to connection window
+        self.received = 0
+        # Number of streams sent at the same time, fewer if server accepts fewer
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        # Signalled when a stream is released
+        self.released = threading.Condition(self.lock)
+        # Stream id to Stream
+        self.streams = {}
+        self.error = None
+
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=True, header_encoding="utf-8"))
+        self.conn.initiate_connection()
+        self.conn.update_settings({
+            h2.settings.SettingCodes.ENABLE_PUSH: 0,
+            h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: window_size,
+        })
+        if connection_window > self.conn.inbound_flow_control_window:
+            self.conn.increment_flow_control_window(connection_window - self.conn.inbound_flow_control_window)
+        self.sock.sendall(self.conn.data_to_send())
+
+        self.reader = threading.Thread(target=self.read, name="h2-{}".format(authority))
+        self.reader.setDaemon(True)
+        self.reader.start()
+
+    @property
+    def closed(self):
+        return self.error is not None
+
+    def load(self):
+        """
+        Get number of open streams.
+        """
+        return len(self.streams)
+
+    def capacity(self):
+        """
+        Get number of streams server accepts at the same time.
+        """
+        return min(self.conn.remote_settings.max_concurrent_streams, self.max_streams)
+
+    def request(self, method, path, headers, timeout):
+        """
+        Send request, wait while the connection has as many streams as server accepts.
+
+        method: HTTP method
+        path: path and query of url
+        headers: dict of extra headers
+        timeout: seconds to wait for free stream
+
+        Returns:
+        stream: Stream of the request
+        """
+        with self.lock:
+            if not self.released.wait_for(lambda: self.error is not None or len(self.streams) < self.capacity(), timeout):
+                raise socket.timeout("no free HTTP/2 stream on {}".format(self.authority))
+            if self.error is not None:
+                raise self.error
+
+            id = self.conn.get_next_available_stream_id()
+            stream = self.streams[id] = Stream(self, id)
+            fields = [(":method", method), (":scheme", self.scheme), (":authority", self.authority), (":path", path or "/")]
+            fields.extend((k.lower(), str(v)) for k, v in headers.items())
+            self.conn.send_headers(id, fields, end_stream=True)
+            self.flush()
+        return stream
+
+    def acknowledge(self, id, length):
+        """
+        Give back stream window of data taken by stream.
+        """
+        with self.lock:
+            if self.error is None and length > 0:
+                try:
+                    self.conn.increment_flow_control_window(length, id)
+                except (KeyError, h2.exceptions.StreamClosedError):
+                    # Server already ended or reset the stream, its window is not needed
+                    return
+                self.flush()
+
+    def close_stream(self, stream, cancel=False):
+        """
+        Release stream, reset it if server is still sending.
+        """
+        with self.lock:
+            if self.streams.pop(stream.id, None) is None:
+                return
+            if cancel and self.error is None:
+                try:
+                    self.conn.reset_stream(stream.id, h2.errors.ErrorCodes.CANCEL)
+                except h2.exceptions.StreamClosedError:
+                    pass
+            self.flush()
+            self.released.notify_all()
+
+    def flush(self):
+        # Called under lock
+        data = self.conn.data_to_send()
+        if data and self.error is None:
+            self.sock.sendall(data)
+
+    def read(self):
+        """
+        Receive frames until connection is closed, run by reader thread.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        try:
+            while True:
+                # Wait outside lock so writers are not blocked, data may already be buffered by TLS
+                if not (isinstance(self.sock, ssl.SSLSocket) and self.sock.pending()):
+                    ready = selector.select(1)
+                    if self.error is not None:
+                        return
+                    if not ready:
+                        continue
+                with self.lock:
+                    try:
+                        data = self.sock.recv(65536)
+                    except (socket.timeout, ssl.SSLWantReadError):
+                        continue
+                    if not data:
+                        raise ConnectionError("HTTP/2 connection to {} closed".format(self.authority))
+                    for event in self.conn.receive_data(data):
+                        self.dispatch(event)
+                    self.flush()
+        except Exception as e:
+            self.fail(e)
+        finally:
+            selector.close()
+
+    def dispatch(self, event):
+        # Called under lock
+        if isinstance(event, h2.events.ConnectionTerminated):
+            raise ConnectionError("HTTP/2 connection to {} terminated, error code {}".format(self.authority, event.error_code))
+
+        if isinstance(event, h2.events.DataReceived) and event.flow_controlled_length:
+            # Connection window is given back on receipt, so streams not taking their data do not hold it
+            self.received += event.flow_controlled_length
+            if self.received >= self.connection_window // 2:
+                self.conn.increment_flow_control_window(self.received)
+                self.received = 0
+
+        stream = self.streams.get(getattr(event, "stream_id", None))
+        if stream is None:
+            return
+        if isinstance(event, h2.events.StreamReset):
+            stream.events.put(ConnectionError("HTTP/2 stream {} reset by server, error code {}".format(event.stream_id, event.error_code)))
+        elif isinstance(event, (h2.events.ResponseReceived, h2.events.DataReceived, h2.events.StreamEnded)):
+            stream.events.put(event)
+
+    def fail(self, error):
+        """
+        Close connection, all open streams fail with error.
+        """
+        with self.lock:
+            if self.error is None:
+                self.error = error
+            for stream in self.streams.values():
+                stream.events.put(error)
+            self.released.notify_all()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class Pool:
+    """
+    Pool keeps HTTP/2 connections of each origin, shared by all workers.
+    A new connection is opened only when all connections of the origin have as many streams as server accepts.
+    Origins which do not speak HTTP/2 are remembered and downloaded with HTTP/1.1.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Origin to list of Connection
+        self.connections = {}
+        # Origin to Lock, so an origin is connected once at a time
+        self.connecting = {}
+        # Origins which do not speak HTTP/2
+        self.http1 = set()
+
+    def get(self, worker, url):
+        """
+        Get connection to origin of url.
+
+        worker: Worker downloading the file
+        url: ParseResult of url from urllib.parse.urlparse
+
+        Returns:
+        connection: Connection, or None if origin does not speak HTTP/2
+        """
+        config = worker.config
+        origin = (url.scheme, url.hostname, url.port or {"http": 80, "https": 443}[url.scheme])
+        if url.scheme == "http" and not config.get("http2_prior_knowledge", False):
+            return None
+
+        with self.lock:
+            if origin in self.http1:
+                return None
+            lock = self.connecting.setdefault(origin, threading.Lock())
+
+        with lock:
+            with self.lock:
+                connections = self.connections[origin] = [c for c in self.connections.get(origin, []) if not c.closed]
+                free = [c for c in connections if c.load() < c.capacity()]
+                if free or len(connections) >= config.get("http2_connections", 2):
+                    return min(free or connections, key=Connection.load)
+
+            connection = self.connect(worker, url, origin)
+            with self.lock:
+                if connection is None:
+                    self.http1.add(origin)
+                else:
+                    self.connections[origin].append(connection)
+            return connection
+
+    def connect(self, worker, url, origin):
+        """
+        Open connection to origin, negotiating h2 with ALPN for https.
+
+        Returns:
+        connection: Connection, or None if server does not speak HTTP/2
+        """
+        config = worker.config
+        scheme, host, port = origin
+        sock = worker.resolver.create_connection((host, port), config.get("timeout", 10))
+        if scheme == "https":
+            # ssl_verify is False, True or path of CA bundle, same as verify of requests
+            verify = config.get("ssl_verify", True)
+            context = ssl.create_default_context(cafile=verify if isinstance(verify, str) else None)
+            if verify is False:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            context.set_alpn_protocols(["h2", "http/1.1"])
+            try:
+                sock = context.wrap_socket(sock, server_hostname=host)
+            except Exception:
+                sock.close()
+                raise
+            if sock.selected_alpn_protocol() != "h2":
+                sock.close()
+                return None
+
+        authority = url.netloc.rpartition("@")[2]
+        try:
+            return Connection(sock, scheme, authority, config.get("http2_window_size", 4 << 20),
+                              config.get("http2_connection_window", 16 << 20), config.get("http2_max_streams", 100))
+        except Exception:
+            sock.close()
+            raise
+
+    def close(self):
+        """
+        Close all connections.
+        """
+        with self.lock:
+            connections = [c for origin in self.connections.values() for c in origin]
+            self.connections.clear()
+            self.http1.clear()
+        for connection in connections:
+            connection.fail(ConnectionError("HTTP/2 pool closed"))
+
+# Connections shared by all workers
+pool = Pool()
+
+def request(worker, url, method, headers=None):
+    """
+    Send request to url, following redirects.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    method: HTTP method
+    headers: dict of extra headers
+
+    Returns:
+    stream: Stream with response headers received, or None if origin does not speak HTTP/2
+    url: ParseResult of url of response
+    """
+    timeout = worker.config.get("timeout", 10)
+    headers = dict(headers or {}, **{"user-agent": requests.utils.default_user_agent()})
+    authorization = basic_auth(url)
+    for i in range(requests.models.DEFAULT_REDIRECT_LIMIT + 1):
+        connection = pool.get(worker, url)
+        if connection is None:
+            return None, url
+
+        target = url.path + ("?" + url.query if url.query else "")
+        fields = headers if authorization is None else dict(headers, authorization=authorization)
+        stream = connection.request(method, target, fields, timeout)
+        try:
+            status = stream.response(timeout)
+        except Exception:
+            stream.close()
+            raise
+        if status not in redirects or "location" not in stream.headers:
+            return stream, url
+
+        stream.close()
+        location = urllib.parse.urlparse(urllib.parse.urljoin(url.geturl(), stream.headers["location"]))
+        # Credentials are kept only on the same host, same as requests
+        if location.username is not None or location.hostname != url.hostname:
+            authorization = basic_auth(location)
+        url = location
+        if status == 303:
+            method = "GET"
+    raise requests.exceptions.TooManyRedirects("Exceeded {} redirects.".format(requests.models.DEFAULT_REDIRECT_LIMIT))
+
+def basic_auth(url):
+    """
+    Get Basic authorization of credentials in url, same as requests sends for HTTP/1.1.
+
+    url: ParseResult of url from urllib.parse.urlparse
+
+    Returns:
+    authorization: value of authorization header, or None if url has no credentials
+    """
+    if url.username is None:
+        return None
+    credentials = "{}:{}".format(urllib.parse.unquote(url.username), urllib.parse.unquote(url.password or ""))
+    return "Basic " + base64.b64encode(credentials.encode("latin1")).decode("ascii")
+
+def raise_for_status(stream, url):
+    if stream.status >= 400:
+        raise requests.exceptions.HTTPError("{} Error for url: {}".format(stream.status, url.geturl()))
+
+def size(worker, url, info):
+    """
+    Get size of file over HTTP/2, or over HTTP/1.1 if origin does not speak HTTP/2.
+
+    Returns:
+    size: size of file in bytes, or None if unknown or server does not support range
+    """
+    stream, url = request(worker, url, "HEAD")
+    if stream is None:
+        return http.size_http1(worker, url, info)
+
+    with stream:
+        raise_for_status(stream, url)
+        if stream.headers.get("accept-ranges") != "bytes" or "content-length" not in stream.headers:
+            return None
+        return int(stream.headers["content-length"])
+
+def fetch(worker, url, info, f, offset=0, length=None):
+    """
+    Download file over HTTP/2, or over HTTP/1.1 if origin does not speak HTTP/2.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+    f: writable to write file to
+    offset: position in file to start download from
+    length: number of bytes to download, until end of file if None
+    """
+    headers = {}
+    if offset or length is not None:
+        headers["range"] = "bytes={}-{}".format(offset, "" if length is None else offset + length - 1)
+
+    stream, url = request(worker, url, "GET", headers)
+    if stream is None:
+        return http.fetch_http1(worker, url, info, f, offset, length)
+
+    with stream:
+        raise_for_status(stream, url)
+        http.write_body(worker, stream.iter_content(worker.config.get("timeout", 10)), f,
+                        offset if stream.status != 206 else 0, length)
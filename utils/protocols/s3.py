@@ -0,0 +1,188 @@
+"""
+Backend of S3 protocol, for Amazon S3 and S3-compatible object stores.
+
+Url is s3://bucket/key. Object is requested from s3_endpoint in config with path-style url,
+large object is downloaded with parallel ranged GETs of s3_part_size bytes, s3_parallel at a time.
+Requests are signed with AWS Signature Version 4 if credentials are given, in order of precedence, in
+input attributes access_key and secret_key, config s3_access_key and s3_secret_key,
+or environment variables AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY.
+"""
+import os
+import hmac
+import time
+import hashlib
+import urllib.parse
+from utils import profiler
+from utils.protocols import fetch_parts
+from utils.protocols.http import session
+
+empty_hash = hashlib.sha256(b"").hexdigest()
+
+# Backend can download range of file
+ranges = True
+
+def object_url(worker, url, info):
+    """
+    Get path-style url of object in object store.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+
+    Returns:
+    url: url string of object
+    """
+    endpoint = info.get("endpoint") or worker.config.get("s3_endpoint") or "https://s3.{}.amazonaws.com".format(region(worker, info))
+    return "{}/{}/{}".format(endpoint.rstrip("/"), url.netloc,
+                             urllib.parse.quote(urllib.parse.unquote(url.path.lstrip("/")), safe="/~"))
+
+def size(worker, url, info):
+    """
+    Get size of file.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+
+    Returns:
+    size: size of file in bytes
+    """
+    r = request(worker, info, "HEAD", object_url(worker, url, info))
+    r.raise_for_status()
+    return int(r.headers.get("Content-Length", 0))
+
+def fetch(worker, url, info, f, offset=0, length=None):
+    """
+    Download file using s3 protocol.
+
+    worker: Worker downloading the file
+    url: ParseResult of url from urllib.parse.urlparse
+    info: dict of input attributes
+    f: writable to write file to
+    offset: position in file to start download from
+    length: number of bytes to download, until end of file if None
+    """
+    config = worker.config
+    target = object_url(worker, url, info)
+    part_size = config.get("s3_part_size", 8 << 20)
+    parallel = config.get("s3_parallel", 4)
+
+    end = size(worker, url, info)
+    if length is not None:
+        end = min(offset + length, end)
+
+    # Small object is downloaded with single GET
+    if end - offset <= part_size or parallel <= 1:
+        headers = {}
+        if offset or length is not None:
+            headers["Range"] = "bytes={}-{}".format(offset, end - 1)
+        with request(worker, info, "GET", target, headers, stream=True) as r:
+            r.raise_for_status()
+            # Download file in small chunk to prevent out of memory
+            for chunk in r.iter_content(chunk_size=config.get("chunk_size", 8192)):
+                if chunk:
+                    f.write(chunk)
+                # Use for unit testing to emulate fail download
+                # Can ignore
+                if worker.test_net:
+                    raise Exception("Testing fail download")
+        return
+
+    def get_part(start, end):
+        # Use for unit testing to emulate fail download
+        # Can ignore
+        if worker.test_net:
+            raise Exception("Testing fail download")
+        r = request(worker, info, "GET", target, {"Range": "bytes={}-{}".format(start, end - 1)})
+        r.raise_for_status()
+        if r.status_code != 206 or len(r.content) != end - start:
+            raise IOError("object store returned wrong range {}-{} of {}".format(start, end - 1, target))
+        return r.content
+
+    fetch_parts(f, offset, end, part_size, parallel, get_part)
+
+def region(worker, info):
+    return info.get("region") or worker.config.get("s3_region") or os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+
+def request(worker, info, method, url, headers=None, stream=False):
+    """
+    Send request to object store, signed if credentials are given.
+
+    worker: Worker downloading the file
+    info: dict of input attributes
+    method: HTTP method
+    url: url of object
+    headers: dict of extra headers
+    stream: do not read response body
+
+    Returns:
+    response: requests.Response
+    """
+    headers = dict(headers or {})
+    access_key = info.get("access_key") or worker.config.get("s3_access_key") or os.environ.get("AWS_ACCESS_KEY_ID")
+    secret_key = info.get("secret_key") or worker.config.get("s3_secret_key") or os.environ.get("AWS_SECRET_ACCESS_KEY")
+    token = info.get("session_token") or worker.config.get("s3_session_token") or os.environ.get("AWS_SESSION_TOKEN")
+
+    if access_key and secret_key:
+        if token:
+            headers["X-Amz-Security-Token"] = token
+        with profiler.span("auth"):
+            headers = sign(method, url, headers, access_key, secret_key, region(worker, info))
+
+    return session(worker).request(method, url, headers=headers, stream=stream,
+                                   timeout=worker.config.get("timeout", 10), verify=worker.config.get("ssl_verify", True))
+
+def sign(method, url, headers, access_key, secret_key, region, now=None):
+    """
+    Sign request with AWS Signature Version 4 for S3, with empty payload.
+
+    method: HTTP method
+    url: url of request, path must be already quoted
+    headers: dict of headers, all headers are signed
+    access_key: access key id
+    secret_key: secret access key
+    region: region of bucket
+    now: time of request in seconds since epoch, current time if None
+
+    Returns:
+    headers: dict of headers including Authorization
+    """
+    split = urllib.parse.urlsplit(url)
+    amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(now))
+    date = amz_date[:8]
+
+    headers = dict(headers)
+    headers.setdefault("x-amz-content-sha256", empty_hash)
+    headers["x-amz-date"] = amz_date
+
+    # Host is sent with port only if it is not default port, same as requests
+    host = split.hostname
+    if split.port and split.port != {"http": 80, "https": 443}.get(split.scheme):
+        host = "{}:{}".format(host, split.port)
+
+    signed = dict((k.lower(), " ".join(str(v).split())) for k, v in headers.items())
+    signed["host"] = host
+    names = sorted(signed)
+
+    query = "&".join("{}={}".format(urllib.parse.quote(k, safe="-_.~"), urllib.parse.quote(v, safe="-_.~"))
+                     for k, v in sorted(urllib.parse.parse_qsl(split.query, keep_blank_values=True)))
+    canonical = "\n".join([
+        method,
+        split.path or "/",
+        query,
+        "".join("{}:{}\n".format(name, signed[name]) for name in names),
+        ";".join(names),
+        headers["x-amz-content-sha256"],
+    ])
+
+    scope = "{}/{}/s3/aws4_request".format(date, region)
+    string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode("utf-8")).hexdigest()])
+
+    key = ("AWS4" + secret_key).encode("utf-8")
+    for part in (date, region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    headers["Authorization"] = "AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}".format(
+        access_key, scope, ";".join(names), signature)
+    return headers
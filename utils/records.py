@@ -0,0 +1,160 @@
+"""
+Compact records of works and progress, so runs of millions of files do not keep a dict for each of them.
+"""
+import sys
+import tempfile
+
+class Task:
+    """
+    Task is a file to download, taken by workers from the works Queue in place of dict of input attributes.
+    Destination is interned as many files share a directory, attributes other than url, dest and sink
+    are kept in extra only if there are any.
+    start is called by the worker taking the task, the task is skipped if it returns False, such as
+    set_running_or_notify_cancel of a cancelled future. It is never taken from input attributes.
+    Attributes are read with get, same as dict.
+    """
+    __slots__ = ("url", "dest", "sink", "start", "extra")
+
+    fields = ("url", "dest", "sink", "start")
+
+    def __init__(self, url, dest=None, sink=None, extra=None, start=None):
+        # url string, or tuple of url strings of mirrors
+        self.url = tuple(url) if isinstance(url, list) else url
+        self.dest = intern(dest)
+        self.sink = sink
+        self.start = start
+        self.extra = dict((intern(k), intern(v)) for k, v in extra.items()) if extra else None
+
+    @classmethod
+    def from_info(cls, info):
+        """
+        Create task from input attributes.
+
+        info: dict of input attributes
+
+        Returns:
+        task: Task
+        """
+        extra = dict((k, v) for k, v in info.items() if k not in cls.fields)
+        return cls(info.get("url"), info.get("dest"), info.get("sink"), extra)
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra is None:
+            return default
+        return self.extra.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+class Progress:
+    """
+    Progress is the progress of a work reported by a worker, read and written with get and [] same as dict.
+    """
+    __slots__ = ("filename", "filepath", "state", "error")
+
+    def __init__(self, filename=None, filepath=None, state=None, error=None):
+        self.filename = filename
+        self.filepath = filepath
+        self.state = state
+        self.error = error
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def copy(self):
+        return Progress(self.filename, self.filepath, self.state, self.error)
+
+    def to_dict(self):
+        return dict((key, getattr(self, key)) for key in self.__slots__ if getattr(self, key) is not None)
+
+    def __repr__(self):
+        return "Progress({})".format(self.to_dict())
+
+class FailureLog:
+    """
+    FailureLog keeps failed files with class name and message of their error instead of the error itself,
+    which would keep its traceback and frames alive.
+    At most limit failures are kept in memory, further failures are appended to a file.
+    """
+    def __init__(self, limit=10000, path=None):
+        self.limit = limit
+        # Path of file to append failures to, temporary file if None
+        self.path = path
+        # Number of work to (filename, error)
+        self.failures = {}
+        # Number of failures written to file
+        self.spilled = 0
+        self.file = None
+
+    def add(self, i, filename, error):
+        """
+        Record failed file.
+
+        i: number of work
+        filename: name of file
+        error: exception or message of failure
+        """
+        record = (filename or "", describe(error))
+        if len(self.failures) < self.limit:
+            self.failures[i] = record
+            return
+
+        if self.file is None:
+            if self.path is None:
+                self.file = tempfile.NamedTemporaryFile("w", prefix="failures-", suffix=".tsv", delete=False)
+                self.path = self.file.name
+            else:
+                self.file = open(self.path, "w")
+        self.file.write("{}\t{}\t{}\n".format(i, *(" ".join(str(s).split()) for s in record)))
+        self.spilled += 1
+
+    def items(self):
+        """
+        Get failures kept in memory.
+
+        Returns:
+        items: iterator of (i, (filename, error))
+        """
+        return self.failures.items()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __len__(self):
+        return len(self.failures) + self.spilled
+
+def describe(error):
+    """
+    Get class name and message of error.
+
+    error: exception, message, or None
+
+    Returns:
+    description: string of the error
+    """
+    if error is None:
+        return ""
+    if isinstance(error, BaseException):
+        return "{}: {}".format(type(error).__name__, error)
+    return str(error)
+
+def intern(value):
+    # Share equal strings, other values are kept as they are
+    return sys.intern(value) if type(value) is str else value
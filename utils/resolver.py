@@ -0,0 +1,236 @@
+import os
+import time
+import errno
+import socket
+import selectors
+import threading
+from utils import profiler
+
+class Resolver:
+    """
+    Resolver caches addresses of hosts for ttl seconds and connects to hosts, shared by all workers and protocols.
+    Connection races addresses of a host as in RFC 8305, happy eyeballs: addresses are tried alternating
+    between IPv6 and IPv4, a new attempt is started every delay seconds without waiting for the previous one,
+    and the first connection established is used.
+    """
+    def __init__(self, ttl=300, delay=0.25):
+        # Seconds addresses are cached
+        self.ttl = ttl
+        # Seconds to wait before starting next connection attempt
+        self.delay = delay
+        self.lock = threading.Lock()
+        # (host, port) to (time of expiry, addresses)
+        self.cache = {}
+        # (host, port) being resolved to Event, so a host is resolved once at a time
+        self.resolving = {}
+        # Metrics
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_time = 0.0
+        self.connects = 0
+        self.connect_fails = 0
+        self.connect_time = 0.0
+        self.max_connect_time = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create resolver from config.
+
+        config: dict of config
+
+        Returns:
+        resolver: Resolver
+        """
+        return cls(config.get("dns_ttl", 300), config.get("happy_eyeballs_delay", 0.25))
+
+    def resolve(self, host, port):
+        """
+        Get addresses of host from cache, or from system resolver if not cached or expired.
+
+        host: hostname or ip address
+        port: port number
+
+        Returns:
+        addresses: list of (family, type, proto, canonname, sockaddr) in order to try
+        """
+        key = (host, port)
+        while True:
+            with self.lock:
+                cached = self.cache.get(key)
+                if cached is not None and cached[0] > time.monotonic():
+                    self.hits += 1
+                    return cached[1]
+                event = self.resolving.get(key)
+                if event is None:
+                    event = self.resolving[key] = threading.Event()
+                    break
+            # Wait for other thread resolving the same host
+            event.wait()
+
+        try:
+            start = time.monotonic()
+            with profiler.span("resolve", host=host):
+                addresses = self.interleave(socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM))
+            with self.lock:
+                self.lookups += 1
+                self.lookup_time += time.monotonic() - start
+                self.cache[key] = (time.monotonic() + self.ttl, addresses)
+            return addresses
+        finally:
+            with self.lock:
+                del self.resolving[key]
+            event.set()
+
+    @staticmethod
+    def interleave(addresses):
+        """
+        Order addresses alternating between families, starting with family of the first address.
+
+        addresses: list of addresses from socket.getaddrinfo
+
+        Returns:
+        addresses: reordered list of addresses
+        """
+        families = {}
+        for address in addresses:
+            families.setdefault(address[0], []).append(address)
+        groups = list(families.values())
+
+        ordered = []
+        for i in range(max(len(group) for group in groups) if groups else 0):
+            for group in groups:
+                if i < len(group):
+                    ordered.append(group[i])
+        return ordered
+
+    def create_connection(self, address, timeout=None, source_address=None, socket_options=None):
+        """
+        Connect to host, same as socket.create_connection.
+
+        address: (host, port)
+        timeout: timeout in seconds of connecting and of the returned socket, None to block
+        source_address: (host, port) to bind socket to before connecting
+        socket_options: list of (level, option, value) to set on socket
+
+        Returns:
+        sock: connected socket
+        """
+        host, port = address[:2]
+        addresses = self.resolve(host, port)
+
+        start = time.monotonic()
+        try:
+            with profiler.span("connect", host=host):
+                sock = self.race(addresses, timeout, source_address, socket_options)
+        except Exception:
+            with self.lock:
+                self.connect_fails += 1
+            raise
+        elapsed = time.monotonic() - start
+
+        with self.lock:
+            self.connects += 1
+            self.connect_time += elapsed
+            self.max_connect_time = max(self.max_connect_time, elapsed)
+        return sock
+
+    def race(self, addresses, timeout, source_address, socket_options):
+        """
+        Connect to addresses, starting next attempt every delay seconds or as soon as an attempt failed.
+
+        Returns:
+        sock: first connected socket
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        addresses = list(addresses)
+        selector = selectors.DefaultSelector()
+        pending = []
+        errors = []
+        winner = None
+        next_attempt = time.monotonic()
+
+        try:
+            while winner is None and (addresses or pending):
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise socket.timeout("timed out")
+
+                # Start next attempt
+                if addresses and (not pending or now >= next_attempt):
+                    family, type, proto, canonname, sockaddr = addresses.pop(0)
+                    sock = None
+                    try:
+                        sock = socket.socket(family, type, proto)
+                        for option in socket_options or []:
+                            sock.setsockopt(*option)
+                        if source_address:
+                            sock.bind(source_address)
+                        sock.setblocking(False)
+                        err = sock.connect_ex(sockaddr)
+                        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                            raise OSError(err, os.strerror(err))
+                    except OSError as e:
+                        if sock is not None:
+                            sock.close()
+                        errors.append(e)
+                        continue
+                    if err == 0:
+                        winner = sock
+                        break
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    pending.append(sock)
+                    next_attempt = now + self.delay
+                    continue
+
+                # Wait until an attempt finished, next attempt is due or timeout
+                wait = max(next_attempt - now, 0) if addresses else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                for key, events in selector.select(wait):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    pending.remove(sock)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err == 0:
+                        winner = sock
+                        break
+                    sock.close()
+                    errors.append(OSError(err, os.strerror(err)))
+                    # Failed attempt starts next one immediately
+                    next_attempt = time.monotonic()
+        finally:
+            for sock in pending:
+                sock.close()
+            selector.close()
+
+        if winner is None:
+            if errors:
+                raise errors[-1]
+            raise OSError("getaddrinfo returns an empty list")
+
+        winner.setblocking(True)
+        winner.settimeout(timeout)
+        return winner
+
+    def metrics(self):
+        """
+        Get metrics of resolving and connecting.
+
+        Returns:
+        metrics: dict of counters, times in seconds
+        """
+        with self.lock:
+            return {
+                "dns_lookups": self.lookups,
+                "dns_cache_hits": self.hits,
+                "dns_lookup_time": self.lookup_time,
+                "connects": self.connects,
+                "connect_fails": self.connect_fails,
+                "connect_time": self.connect_time,
+                "avg_connect_time": self.connect_time / self.connects if self.connects else 0.0,
+                "max_connect_time": self.max_connect_time,
+            }
+
+# Resolver shared by workers not given their own
+default = Resolver()
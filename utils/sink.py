@@ -0,0 +1,197 @@
+import io
+from queue import Queue
+
+class Sink:
+    """
+    Sink is a destination of downloaded data other than a file in dest.
+    A Worker opens the sink once per download attempt and writes the data to the returned writer,
+    the attempt is committed when the writer context exits without exception and aborted otherwise.
+    Subclass implements write and optionally commit, abort and fail.
+    """
+    def open(self, name):
+        """
+        Open writer for a download attempt.
+
+        name: destination path of file
+
+        Returns:
+        writer: SinkWriter passing data to the sink
+        """
+        return SinkWriter(self, name)
+
+    def write(self, data, offset):
+        """
+        Receive downloaded data.
+
+        data: chunk of bytes
+        offset: position of chunk in file
+        """
+        raise NotImplementedError
+
+    def commit(self, writer):
+        """
+        Called when download attempt succeed.
+
+        writer: SinkWriter of the attempt
+        """
+        pass
+
+    def abort(self, writer):
+        """
+        Called when download attempt failed, the download may be retried.
+
+        writer: SinkWriter of the attempt
+        """
+        pass
+
+    def fail(self, error):
+        """
+        Called when download failed after all attempts.
+
+        error: reason of failure
+        """
+        pass
+
+class SinkWriter:
+    """
+    SinkWriter is a writable file passing data of a download attempt to its sink.
+    """
+    def __init__(self, sink, name):
+        self.sink = sink
+        # Destination path of file
+        self.name = name
+        # Path of saved file if sink saves to a file
+        self.path = None
+        # Number of bytes written in this attempt
+        self.offset = 0
+
+    def write(self, data):
+        self.sink.write(data, self.offset)
+        self.offset += len(data)
+        return len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.sink.commit(self)
+        else:
+            self.sink.abort(self)
+        return False
+
+class BufferSink(Sink):
+    """
+    BufferSink keeps downloaded file in memory.
+    """
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def open(self, name):
+        # Retried download starts again from the beginning
+        self.buffer = io.BytesIO()
+        return super(BufferSink, self).open(name)
+
+    def write(self, data, offset):
+        self.buffer.write(data)
+
+    def getvalue(self):
+        """
+        Get downloaded file.
+
+        Returns:
+        data: bytes of file
+        """
+        return self.buffer.getvalue()
+
+class StreamSink(Sink):
+    """
+    StreamSink passes downloaded data to a writable given by the caller as soon as it arrives.
+    Data cannot be taken back once passed, so a retried download skips data which was already passed.
+    """
+    def __init__(self, writable):
+        self.writable = writable
+        # Number of bytes already passed to writable
+        self.position = 0
+
+    def write(self, data, offset):
+        # Skip data already passed in previous attempt
+        if offset + len(data) <= self.position:
+            return
+        data = data[max(self.position - offset, 0):]
+        self.send(data)
+        self.position += len(data)
+
+    def send(self, data):
+        """
+        Pass new data to writable.
+
+        data: chunk of bytes
+        """
+        self.writable.write(data)
+
+    def commit(self, writer):
+        if hasattr(self.writable, "flush"):
+            self.writable.flush()
+
+class IteratorSink(StreamSink):
+    """
+    IteratorSink is an iterator, and async iterator, over chunks of downloaded data.
+    Iteration ends when download succeed and raise the error when download failed.
+    maxsize limits number of chunks waiting to be consumed, the download waits for consumer when it is full.
+    """
+    end = object()
+
+    def __init__(self, maxsize=0):
+        super(IteratorSink, self).__init__(Queue(maxsize=maxsize))
+        self.error = None
+        self.done = False
+
+    def send(self, data):
+        self.writable.put(data)
+
+    def commit(self, writer):
+        self.writable.put(self.end)
+
+    def fail(self, error):
+        self.error = error
+        self.writable.put(self.end)
+
+    def get_chunk(self):
+        """
+        Wait for next chunk of downloaded data.
+
+        Returns:
+        chunk: bytes, or None when download finished
+        """
+        if self.done:
+            return None
+        chunk = self.writable.get()
+        if chunk is self.end:
+            self.done = True
+            if self.error is not None:
+                raise self.error
+            return None
+        return chunk
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.get_chunk()
+        if chunk is None:
+            raise StopIteration
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Imported only when used asynchronously, asyncio is slow to import
+        import asyncio
+        # Wait for chunk in a thread so event loop is not blocked
+        loop = asyncio.get_running_loop()
+        chunk = await loop.run_in_executor(None, self.get_chunk)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
@@ -2,6 +2,7 @@ import threading
 import sys
 import os
 import time
+from utils.records import FailureLog
 
 class Visualizer(threading.Thread):
     """
@@ -9,8 +10,9 @@ class Visualizer(threading.Thread):
     It does not involve in downloading a file and only take care of showing the progress.
     It will show files that are downloaded successfully, failed, and a progress bar showing number of files downloaded.
     At the end it will print number of success and fail, as well as a reason for failure.
+    Only class and message of errors are kept, failures past max_failures are written to failure_path.
     """
-    def __init__(self, task, progresses, group=None, target=None, name=None,
+    def __init__(self, task, progresses, max_failures=10000, failure_path=None, group=None, target=None, name=None,
                  args=(), kwargs=None, verbose=None):
         super(Visualizer, self).__init__()
         self.target = target
@@ -23,8 +25,8 @@ class Visualizer(threading.Thread):
         self.fail = 0
         # Queue to get progress report from workers
         self.progresses = progresses
-        # Dict to hold fail work
-        self.results = {}
+        # Fail works
+        self.results = FailureLog(max_failures, failure_path)
     
     def run(self):
         while self.task != self.success + self.fail:
@@ -35,7 +37,7 @@ class Visualizer(threading.Thread):
                 if progress[1].get("state") == "Success":
                     self.success += 1
                 else:
-                    self.results[progress[0]] = progress[1]
+                    self.results.add(progress[0], progress[1].get("filename"), progress[1].get("error"))
                     self.fail += 1
 
                 # Print result of file download
@@ -71,6 +73,9 @@ class Visualizer(threading.Thread):
         """
         print("\n{} Success, {} Failed".format(self.success, self.fail))
         print("\nFailed downloaded:")
-        for i, info in self.results.items():
-            print("file {}({})\t\t{}".format(i, info.get("filename", ""), info.get("error")))
+        for i, (filename, error) in self.results.items():
+            print("file {}({})\t\t{}".format(i, filename, error))
+        self.results.close()
+        if self.results.spilled:
+            print("{} more failed files are written to {}".format(self.results.spilled, self.results.path))
         print('\nSee the reason for the error in the console.')
\ No newline at end of file